@@ -0,0 +1,41 @@
+"""
+Benchmarks each signing algorithm on the token paths.
+
+Reports the time per call for ``encode_jwt_token`` and ``extract_jwt_token``
+and the size of the issued token for HS256, RS256, ES256 and EdDSA. The
+asymmetric algorithms require the cryptography package.
+"""
+from common import User, make_app, report
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+
+
+def private_keys():
+    return {
+        "HS256": None,
+        "RS256": rsa.generate_private_key(public_exponent=65537, key_size=2048),
+        "ES256": ec.generate_private_key(ec.SECP256R1()),
+        "EdDSA": ed25519.Ed25519PrivateKey.generate(),
+    }
+
+
+def main():
+    for (algorithm, private_key) in private_keys().items():
+        app, guard = make_app(JWT_ALGORITHM=algorithm, JWT_PRIVATE_KEY=private_key)
+        with app.app_context():
+            user = User.create(1, "TheDude", roles="admin")
+            token = guard.encode_jwt_token(user)
+
+            def encode():
+                guard.encode_jwt_token(user)
+
+            def extract():
+                guard.extract_jwt_token(token)
+
+            number = 100 if algorithm == "RS256" else 2000
+            report("{} encode_jwt_token".format(algorithm), encode, number=number)
+            report("{} extract_jwt_token".format(algorithm), extract, number=2000)
+            print("{:<48} {:>10} B".format("{} token size".format(algorithm), len(token)))
+
+
+if __name__ == "__main__":
+    main()
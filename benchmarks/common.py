@@ -0,0 +1,73 @@
+"""
+Shared helpers for the flask-praetorian benchmark scripts.
+
+The scripts in this directory are run directly in an environment where
+flask-praetorian is installed, e.g.::
+
+    $ poetry run python benchmarks/tokens.py
+"""
+import timeit
+
+import flask
+
+import flask_praetorian
+
+
+class User:
+    """
+    A minimal in-memory user class so that the benchmarks measure praetorian
+    rather than a database
+    """
+
+    registry = {}
+
+    def __init__(self, id=None, username=None, password=None, roles=""):
+        self.id = id
+        self.username = username
+        self.password = password
+        self.roles = roles
+
+    @property
+    def identity(self):
+        return self.id
+
+    @property
+    def rolenames(self):
+        return [r for r in self.roles.split(",") if r]
+
+    @classmethod
+    def lookup(cls, username):
+        for user in cls.registry.values():
+            if user.username == username:
+                return user
+        return None
+
+    @classmethod
+    def identify(cls, id):
+        return cls.registry.get(id)
+
+    @classmethod
+    def create(cls, id, username, **kwargs):
+        user = cls(id=id, username=username, **kwargs)
+        cls.registry[id] = user
+        return user
+
+
+def make_app(**config):
+    """
+    Builds a flask app with a guard initialized for the benchmark User class
+    """
+    app = flask.Flask(__name__)
+    app.config["SECRET_KEY"] = "benchmark secret"
+    app.config.update(config)
+    guard = flask_praetorian.Praetorian(app, User)
+    return app, guard
+
+
+def report(label, func, number=10000, repeat=5):
+    """
+    Times a function and prints the best per-call time in microseconds
+    """
+    best = min(timeit.repeat(func, number=number, repeat=repeat)) / number
+    print("{:<48} {:>10.2f} us".format(label, best * 1e6))
+    return best
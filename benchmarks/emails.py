@@ -0,0 +1,63 @@
+"""
+Benchmarks the registration and password reset email flows at volume.
+
+Emails are captured by the memory or spool mail backend, so the benchmark
+measures token encoding, template rendering and message building rather than
+a mail server. Reports the time per email sent one at a time and in bulk.
+"""
+import tempfile
+
+from common import User, make_app, report
+
+USERS = 1000
+
+
+def run(label, **config):
+    app, guard = make_app(
+        PRAETORIAN_CONFIRMATION_SENDER="registration@praetorian.com",
+        PRAETORIAN_RESET_SENDER="reset@praetorian.com",
+        **config,
+    )
+    with app.app_context():
+        pairs = [
+            ("user{}@praetorian.com".format(i), User.create(i, "user{}".format(i)))
+            for i in range(USERS)
+        ]
+        (email, user) = pairs[0]
+
+        def registration():
+            guard.send_registration_email(email, user)
+
+        def reset():
+            guard.send_reset_email(email, user)
+
+        def bulk_registration():
+            guard.send_registration_emails(pairs)
+
+        def bulk_reset():
+            guard.send_reset_emails(pairs)
+
+        report("{} send_registration_email".format(label), registration, 1000)
+        report("{} send_reset_email".format(label), reset, 1000)
+        best = report(
+            "{} send_registration_emails ({})".format(label, USERS),
+            bulk_registration,
+            1,
+        )
+        print("{:<48} {:>10.2f} us".format("  per email", best / USERS * 1e6))
+        best = report("{} send_reset_emails ({})".format(label, USERS), bulk_reset, 1)
+        print("{:<48} {:>10.2f} us".format("  per email", best / USERS * 1e6))
+
+
+def main():
+    run("memory", PRAETORIAN_MAIL_BACKEND="memory")
+    with tempfile.TemporaryDirectory() as spool_dir:
+        run(
+            "spool",
+            PRAETORIAN_MAIL_BACKEND="spool",
+            PRAETORIAN_MAIL_SPOOL_DIR=spool_dir,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Benchmarks the cost of importing flask_praetorian in a fresh interpreter.
+
+Reports the median wall time of ``import flask_praetorian`` (which includes
+flask itself), of a startup that also initializes a guard and of the same
+startup with hashing disabled, as in a verify-only service. It also lists
+which optional dependencies each of them loaded.
+"""
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+OPTIONAL_MODULES = ["pendulum", "passlib", "flask_mailman", "jinja2"]
+
+IMPORT_ONLY = "import flask_praetorian"
+
+VERIFY_ONLY = """
+import flask
+import flask_praetorian
+from common import User
+app = flask.Flask(__name__)
+app.config["SECRET_KEY"] = "benchmark secret"
+app.config["PRAETORIAN_HASH_DISABLED"] = {}
+flask_praetorian.Praetorian(app, User)
+"""
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+LOADED = """
+import sys
+print(",".join(m for m in {} if m in sys.modules))
+"""
+
+
+def measure(code, runs=10):
+    """
+    Runs code in fresh interpreters and returns the median time in ms and
+    the optional modules it loaded
+    """
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], check=True, cwd=HERE)
+        timings.append((time.perf_counter() - start) * 1000)
+    loaded = subprocess.run(
+        [sys.executable, "-c", code + LOADED.format(OPTIONAL_MODULES)],
+        check=True,
+        cwd=HERE,
+        capture_output=True,
+        text=True,
+    ).stdout.strip()
+    return statistics.median(timings), loaded or "-"
+
+
+def main():
+    baseline, _ = measure("pass")
+    cases = [
+        ("import", IMPORT_ONLY),
+        ("init", VERIFY_ONLY.format(False)),
+        ("verify-only init", VERIFY_ONLY.format(True)),
+    ]
+    for label, code in cases:
+        elapsed, loaded = measure(code)
+        print(
+            "{:<24} {:>8.1f} ms   loaded: {}".format(label, elapsed - baseline, loaded)
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Benchmarks the password paths that run for every login.
+
+Reports the time per call for ``authenticate`` with a current hash and with a
+legacy hash that is upgraded by ``PRAETORIAN_HASH_AUTOUPDATE``, and compares
+verifying through passlib with ``PRAETORIAN_HASH_DIRECT``. Also times hashing
+a batch of passwords serially and with ``hash_passwords()``.
+"""
+from common import User, make_app, report
+from passlib.hash import pbkdf2_sha512
+
+SCHEMES = ["pbkdf2_sha512", "pbkdf2_sha256"]
+
+
+def main():
+    _, legacy_guard = make_app(
+        PRAETORIAN_HASH_ALLOWED_SCHEMES=SCHEMES,
+        PRAETORIAN_HASH_SCHEME="pbkdf2_sha256",
+    )
+    legacy_hash = legacy_guard.hash_password("abides")
+
+    app, guard = make_app(
+        PRAETORIAN_HASH_ALLOWED_SCHEMES=SCHEMES,
+        PRAETORIAN_HASH_DEPRECATED_SCHEMES=["pbkdf2_sha256"],
+        PRAETORIAN_HASH_AUTOUPDATE=True,
+    )
+    with app.app_context():
+        user = User.create(1, "TheDude", password=guard.hash_password("abides"))
+        current_hash = user.password
+
+        def authenticate_current():
+            user.password = current_hash
+            guard.authenticate("TheDude", "abides")
+
+        def authenticate_legacy():
+            user.password = legacy_hash
+            guard.authenticate("TheDude", "abides")
+
+        report("authenticate (current hash)", authenticate_current, number=20)
+        report("authenticate (legacy hash, autoupdate)", authenticate_legacy, 20)
+
+    # A single round leaves only the per-call overhead around the hash itself
+    _, direct_guard = make_app(PRAETORIAN_HASH_DIRECT=True)
+    hashed_password = pbkdf2_sha512.using(rounds=1).hash("abides")
+    report(
+        "verify 1 round pbkdf2_sha512 (passlib)",
+        lambda: guard._verify_password("abides", hashed_password),
+    )
+    report(
+        "verify 1 round pbkdf2_sha512 (direct)",
+        lambda: direct_guard._verify_password("abides", hashed_password),
+    )
+
+    passwords = ["password-{}".format(i) for i in range(64)]
+    report(
+        "hash 64 passwords (serial)",
+        lambda: [guard.hash_password(password) for password in passwords],
+        number=1,
+        repeat=1,
+    )
+    report(
+        "hash 64 passwords (hash_passwords)",
+        lambda: list(guard.hash_passwords(passwords)),
+        number=1,
+        repeat=1,
+    )
+
+
+if __name__ == "__main__":
+    main()
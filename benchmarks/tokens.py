@@ -0,0 +1,230 @@
+"""
+Benchmarks the token paths that run for every login and authenticated request.
+
+Reports the time per call for ``encode_jwt_token``, ``_validate_jwt_data`` and
+``extract_jwt_token`` and the transient memory that a successful validation
+allocates. That memory is the integer timestamp read from the clock, which
+every validation needs. The encode and extract paths are also timed in opaque
+token mode and with compressed payloads, along with the size of the tokens
+issued, and with each JSON codec. The pyjwt based codec is compared with the precomputed
+HMAC codec for signing and verifying. Anonymous requests to optional auth
+routes are timed, and so is rejecting oversized, malformed, expired and forged
+tokens with and without the rejected token cache. Finally, minting tokens for
+many users one at a time is compared with ``encode_jwt_tokens``, and
+refreshing is timed with and without rotating refresh families.
+"""
+import tracemalloc
+
+from common import User, make_app, report
+
+from flask_praetorian.codecs import HMACJWTCodec, JWTCodec
+from flask_praetorian.constants import VITAM_AETERNUM, AccessType
+from flask_praetorian.exceptions import PraetorianError
+
+
+def peak_bytes(func, number):
+    """
+    Measures the peak memory allocated above the baseline while calling func
+    """
+    func()
+    tracemalloc.start()
+    try:
+        baseline, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        for _ in range(number):
+            func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak - baseline
+
+
+def transient_bytes(func, number=10000):
+    """
+    Measures the peak memory allocated while calling func, less the peak that
+    the measuring loop allocates while calling a function that does nothing
+    """
+    return peak_bytes(func, number) - peak_bytes(lambda: None, number)
+
+
+def main():
+    app, guard = make_app()
+    with app.app_context():
+        user = User.create(1, "TheDude", roles="admin")
+        token = guard.encode_jwt_token(user)
+        data = guard.extract_jwt_token(token)
+
+        def encode():
+            guard.encode_jwt_token(user)
+
+        def validate():
+            guard._validate_jwt_data(data, AccessType.access)
+
+        def extract():
+            guard.extract_jwt_token(token)
+
+        report("encode_jwt_token", encode)
+        report("_validate_jwt_data", validate, number=100000)
+        report("extract_jwt_token", extract)
+        print(
+            "{:<48} {:>10} B".format(
+                "_validate_jwt_data transient peak",
+                transient_bytes(validate),
+            )
+        )
+
+    claims = {"claim{}".format(i): "value{}".format(i) for i in range(20)}
+    for mode in ("jwt", "opaque"):
+        app, guard = make_app(PRAETORIAN_TOKEN_MODE=mode)
+        with app.app_context():
+            user = User.create(1, "TheDude", roles="admin")
+            token = guard.encode_jwt_token(user, **claims)
+
+            def encode():
+                guard.encode_jwt_token(user, **claims)
+
+            def extract():
+                guard.extract_jwt_token(token)
+
+            # Extract first so that encoding does not evict the token
+            report("{} extract_jwt_token (20 claims)".format(mode), extract)
+            report("{} encode_jwt_token (20 claims)".format(mode), encode)
+            print("{:<48} {:>10} B".format("{} token size".format(mode), len(token)))
+
+    tenants = {"tenant{}".format(i): ["read", "write", "admin"] for i in range(100)}
+    for threshold in (None, 1024):
+        label = "compressed" if threshold else "uncompressed"
+        app, guard = make_app(JWT_COMPRESSION_THRESHOLD=threshold)
+        with app.app_context():
+            user = User.create(1, "TheDude", roles="admin")
+            token = guard.encode_jwt_token(user, tenants=tenants)
+
+            def encode():
+                guard.encode_jwt_token(user, tenants=tenants)
+
+            def extract():
+                guard.extract_jwt_token(token)
+
+            report("{} encode_jwt_token (100 tenants)".format(label), encode)
+            report("{} extract_jwt_token (100 tenants)".format(label), extract)
+            print("{:<48} {:>10} B".format("{} token size".format(label), len(token)))
+
+    for codec in ("json", "orjson"):
+        try:
+            app, guard = make_app(PRAETORIAN_JSON_CODEC=codec)
+        except Exception as err:
+            print("{:<48} {}".format(codec, err))
+            continue
+        with app.app_context():
+            user = User.create(1, "TheDude", roles="admin")
+            token = guard.encode_jwt_token(user, tenants=tenants)
+
+            def encode():
+                guard.encode_jwt_token(user, tenants=tenants)
+
+            def extract():
+                guard.extract_jwt_token(token)
+
+            report("{} encode_jwt_token (100 tenants)".format(codec), encode)
+            report("{} extract_jwt_token (100 tenants)".format(codec), extract)
+
+    payload = {"iat": 1495391995, "exp": 1495392895, "id": 1, "rls": "admin"}
+    for (label, codec) in (
+        ("pyjwt", JWTCodec()),
+        ("hmac", HMACJWTCodec("secret")),
+    ):
+        token = codec.encode(payload, "secret", "HS256")
+        report(
+            "{} codec encode".format(label),
+            lambda: codec.encode(payload, "secret", "HS256"),
+            number=100000,
+        )
+        report(
+            "{} codec decode".format(label),
+            lambda: codec.decode(token, "secret", ["HS256"]),
+            number=100000,
+        )
+
+    app, guard = make_app()
+
+    @guard.auth_accepted
+    def public():
+        return "ok"
+
+    def read_token():
+        try:
+            guard.read_token()
+        except PraetorianError:
+            pass
+
+    with app.test_request_context("/"):
+        report("anonymous read_token", read_token)
+        report("anonymous probe_token", guard.probe_token)
+        report("anonymous auth_accepted", public)
+
+    for cache_size in (0, 10000):
+        app, guard = make_app(PRAETORIAN_REJECTED_TOKEN_CACHE_SIZE=cache_size)
+        now = [1495391995]
+        guard.clock = lambda: now[0]
+        with app.app_context():
+            user = User.create(1, "TheDude", roles="admin")
+            token = guard.encode_jwt_token(user)
+            (header, payload, signature) = token.split(".")
+            now[0] += guard._access_lifespan_seconds + 1
+            for (label, bad_token) in (
+                ("oversized", token * 100),
+                ("malformed", "junk.junk"),
+                ("expired", token),
+                ("forged", ".".join([header, payload, signature[::-1]])),
+            ):
+
+                def reject():
+                    try:
+                        guard.extract_jwt_token(bad_token)
+                    except PraetorianError:
+                        pass
+
+                cached = " (cached)" if cache_size else ""
+                report("reject {} token{}".format(label, cached), reject)
+
+    app, guard = make_app()
+    with app.app_context():
+        users = [User.create(i, "user{}".format(i)) for i in range(1000)]
+
+        def one_at_a_time():
+            for user in users:
+                guard.encode_jwt_token(user, tenant="abides")
+
+        def bulk():
+            guard.encode_jwt_tokens(users, tenant="abides")
+
+        def bulk_pool():
+            guard.encode_jwt_tokens(users, max_workers=4, tenant="abides")
+
+        report("encode_jwt_token x 1000", one_at_a_time, number=5)
+        report("encode_jwt_tokens (1000)", bulk, number=5)
+        report("encode_jwt_tokens (1000, 4 workers)", bulk_pool, number=5)
+
+    for rotate in (False, True):
+        app, guard = make_app(PRAETORIAN_ROTATE_REFRESH_TOKENS=rotate)
+        now = [1495391995]
+        guard.clock = lambda: now[0]
+        with app.app_context():
+            user = User.create(1, "TheDude", roles="admin")
+            tokens = [
+                guard.encode_jwt_token(
+                    user,
+                    override_refresh_lifespan=VITAM_AETERNUM,
+                )
+            ]
+
+            def refresh():
+                now[0] += guard._access_lifespan_seconds + 1
+                tokens[0] = guard.refresh_jwt_token(tokens[0])
+
+            label = "rotating" if rotate else "non-rotating"
+            report("{} refresh_jwt_token".format(label), refresh)
+
+
+if __name__ == "__main__":
+    main()
@@ -13,7 +13,10 @@ from flask_praetorian.utilities import (
     current_custom_claims,
 )
 
-from flask_praetorian.user_mixins import SQLAlchemyUserMixin
+from flask_praetorian.user_mixins import (
+    SQLAlchemyPasswordUpdater,
+    SQLAlchemyUserMixin,
+)
 
 
 __all__ = [
@@ -28,4 +31,5 @@ __all__ = [
     current_rolenames,
     current_custom_claims,
     SQLAlchemyUserMixin,
+    SQLAlchemyPasswordUpdater,
 ]
@@ -1,18 +1,44 @@
+import contextlib
 import datetime
 import flask
-import jinja2
-import jwt
-import pendulum
+import functools
+import hashlib
+import logging
+import os
 import re
+import secrets
 import textwrap
 import uuid
 import warnings
 
-from flask_mailman import EmailMessage
-
-from passlib.context import CryptContext
-
-from flask_praetorian.utilities import deprecated, duration_from_string, is_jsonable
+from flask_praetorian.codecs import (
+    HMAC_DIGESTS,
+    HMACJWTCodec,
+    JWTCodec,
+    get_json_codec,
+    load_jwt_keys,
+)
+from flask_praetorian.hashing import (
+    DirectHasher,
+    MemoryBudget,
+    hash_memory_cost,
+    hash_passwords,
+    scheme_memory_cost,
+)
+from flask_praetorian.decorators import (
+    auth_accepted,
+    auth_required,
+    roles_accepted,
+    roles_required,
+)
+from flask_praetorian.utilities import (
+    current_timestamp,
+    deprecated,
+    duration_from_dict,
+    duration_from_string,
+    duration_to_seconds,
+    identity_claim,
+)
 
 from flask_praetorian.exceptions import (
     AuthenticationError,
@@ -29,16 +55,26 @@ from flask_praetorian.exceptions import (
     MissingClaimError,
     MissingToken,
     MissingUserError,
+    MisusedGuardToken,
     MisusedRegistrationToken,
     MisusedResetToken,
+    RefreshTokenReused,
     ConfigurationError,
     PraetorianError,
 )
+from flask_praetorian.stores import (
+    MemoryClaimStore,
+    MemoryRefreshFamilyStore,
+    RejectedTokenCache,
+)
 
 from flask_praetorian.constants import (
     DEFAULT_JWT_ACCESS_LIFESPAN,
     DEFAULT_JWT_ALGORITHM,
     DEFAULT_JWT_ALLOWED_ALGORITHMS,
+    DEFAULT_JWT_COMPRESSION_THRESHOLD,
+    DEFAULT_JWT_MAX_TOKEN_LENGTH,
+    DEFAULT_JSON_CODEC,
     DEFAULT_JWT_PLACES,
     DEFAULT_JWT_COOKIE_NAME,
     DEFAULT_JWT_HEADER_NAME,
@@ -54,16 +90,54 @@ from flask_praetorian.constants import (
     DEFAULT_HASH_AUTOUPDATE,
     DEFAULT_HASH_AUTOTEST,
     DEFAULT_HASH_DEPRECATED_SCHEMES,
+    DEFAULT_HASH_DIRECT,
+    DEFAULT_HASH_DISABLED,
+    DEFAULT_HASH_LAZY,
+    DEFAULT_HASH_MEMORY_BUDGET,
+    DEFAULT_HASH_MEMORY_TIMEOUT,
     DEFAULT_ROLES_DISABLED,
+    DEFAULT_GUARD_NAME,
+    DEFAULT_CLAIM_STORE_SIZE,
+    DEFAULT_OPAQUE_TOKEN_BYTES,
+    DEFAULT_TOKEN_MODE,
+    DEFAULT_REFRESH_FAMILY_STORE_SIZE,
+    DEFAULT_REFRESH_REUSE_GRACE,
+    DEFAULT_REJECTED_TOKEN_CACHE_SIZE,
+    DEFAULT_REJECTED_TOKEN_TTL,
+    DEFAULT_ROTATE_REFRESH_TOKENS,
+    TOKEN_MODES,
+    GUARD_NAME_CLAIM,
     IS_REGISTRATION_TOKEN_CLAIM,
     IS_RESET_TOKEN_CLAIM,
     REFRESH_EXPIRATION_CLAIM,
+    REFRESH_FAMILY_CLAIM,
     RESERVED_CLAIMS,
     VITAM_AETERNUM,
     AccessType,
 )
 
 
+logger = logging.getLogger("flask_praetorian")
+
+
+def _load_template_file(path):
+    """
+    Loads the source of a template file for jinja2. The template is considered
+    up to date for as long as the file's modification time does not change
+    """
+    mtime = os.path.getmtime(path)
+    with open(path) as fh:
+        source = fh.read()
+
+    def uptodate():
+        try:
+            return os.path.getmtime(path) == mtime
+        except OSError:
+            return False
+
+    return source, path, uptodate
+
+
 class Praetorian:
     """
     Comprises the implementation for the flask-praetorian flask extension.
@@ -78,10 +152,29 @@ class Praetorian:
         is_blacklisted=None,
         encode_jwt_token_hook=None,
         refresh_jwt_token_hook=None,
+        name=DEFAULT_GUARD_NAME,
+        clock=None,
+        email_dispatcher=None,
+        claim_store=None,
+        refresh_family_store=None,
+        password_updater=None,
     ):
+        """
+        :param: name:  The name this guard is registered under in the app's
+                       extensions. Supply distinct names to mount several
+                       guards with different user classes in one app. Tokens
+                       issued by a named guard may only be used with it
+        :param: clock: A callable that returns the current time as an integer
+                       unix timestamp. Used when issuing and validating
+                       tokens. Defaults to the system clock. Useful for tests
+        """
+        self._pwd_ctx_settings = None
         self.pwd_ctx = None
+        self.hash_disabled = False
         self.hash_scheme = None
         self.salt = None
+        self.name = name
+        self.clock = clock or current_timestamp
 
         if app is not None and user_class is not None:
             self.init_app(
@@ -90,6 +183,10 @@ class Praetorian:
                 is_blacklisted,
                 encode_jwt_token_hook,
                 refresh_jwt_token_hook,
+                email_dispatcher=email_dispatcher,
+                claim_store=claim_store,
+                refresh_family_store=refresh_family_store,
+                password_updater=password_updater,
             )
 
     def init_app(
@@ -99,6 +196,10 @@ class Praetorian:
         is_blacklisted=None,
         encode_jwt_token_hook=None,
         refresh_jwt_token_hook=None,
+        email_dispatcher=None,
+        claim_store=None,
+        refresh_family_store=None,
+        password_updater=None,
     ):
         """
         Initializes the Praetorian extension
@@ -125,6 +226,28 @@ class Praetorian:
                                         refreshed. Should take payload_parts
                                         which contains the ingredients for
                                         the jwt.
+        :param email_dispatcher:        An EmailDispatcher that may optionally
+                                        be used to send token bearing emails
+                                        outside of the request. By default,
+                                        emails are sent before the request
+                                        returns
+        :param claim_store:             A ClaimStore that may optionally be
+                                        used to keep the claims of opaque
+                                        tokens when PRAETORIAN_TOKEN_MODE is
+                                        "opaque". By default, claims are kept
+                                        in a MemoryClaimStore
+        :param refresh_family_store:    A RefreshFamilyStore that may
+                                        optionally be used to track refresh
+                                        token families when
+                                        PRAETORIAN_ROTATE_REFRESH_TOKENS is
+                                        set. By default, families are kept
+                                        in a MemoryRefreshFamilyStore
+        :param password_updater:        A PasswordUpdater that may optionally
+                                        be used to persist password hashes
+                                        that are upgraded during
+                                        authentication. By default, upgraded
+                                        hashes are assigned to the user and
+                                        the app must save it
         """
         PraetorianError.require_condition(
             app.config.get("SECRET_KEY") is not None,
@@ -146,7 +269,17 @@ class Praetorian:
             DEFAULT_HASH_AUTOTEST,
         )
 
-        self.pwd_ctx = CryptContext(
+        self.hash_disabled = app.config.get(
+            "PRAETORIAN_HASH_DISABLED",
+            DEFAULT_HASH_DISABLED,
+        )
+
+        self.hash_lazy = app.config.get(
+            "PRAETORIAN_HASH_LAZY",
+            DEFAULT_HASH_LAZY,
+        )
+
+        self._pwd_ctx_settings = dict(
             schemes=app.config.get(
                 "PRAETORIAN_HASH_ALLOWED_SCHEMES",
                 DEFAULT_HASH_ALLOWED_SCHEMES,
@@ -160,30 +293,83 @@ class Praetorian:
                 DEFAULT_HASH_DEPRECATED_SCHEMES,
             ),
         )
-
-        valid_schemes = self.pwd_ctx.schemes()
-        PraetorianError.require_condition(
-            self.hash_scheme in valid_schemes or self.hash_scheme is None,
-            "If {} is set, it must be one of the following schemes: {}".format(
-                "PRAETORIAN_HASH_SCHEME",
-                valid_schemes,
-            ),
+        self.hash_memory_budget = None
+        hash_memory_limit = app.config.get(
+            "PRAETORIAN_HASH_MEMORY_BUDGET",
+            DEFAULT_HASH_MEMORY_BUDGET,
         )
+        if hash_memory_limit is not None:
+            ConfigurationError.require_condition(
+                hash_memory_limit > 0,
+                "PRAETORIAN_HASH_MEMORY_BUDGET must be a positive number of bytes",
+            )
+            self.hash_memory_budget = MemoryBudget(
+                hash_memory_limit,
+                timeout=app.config.get(
+                    "PRAETORIAN_HASH_MEMORY_TIMEOUT",
+                    DEFAULT_HASH_MEMORY_TIMEOUT,
+                ),
+            )
+
+        self.direct_hasher = None
+        if not self.hash_disabled and app.config.get(
+            "PRAETORIAN_HASH_DIRECT",
+            DEFAULT_HASH_DIRECT,
+        ):
+            self.direct_hasher = DirectHasher(
+                self._pwd_ctx_settings["schemes"],
+                self._pwd_ctx_settings["default"],
+            )
+
+        self._pwd_ctx = None
+        if not (self.hash_disabled or self.hash_lazy):
+            self._pwd_ctx = self._build_pwd_ctx()
 
         self.user_class = self._validate_user_class(app, user_class)
         self.is_blacklisted = is_blacklisted or (lambda t: False)
         self.encode_jwt_token_hook = encode_jwt_token_hook
         self.refresh_jwt_token_hook = refresh_jwt_token_hook
+        self.email_dispatcher = email_dispatcher
+        self.password_updater = password_updater
 
-        self.encode_key = app.config["SECRET_KEY"]
-        self.allowed_algorithms = app.config.get(
-            "JWT_ALLOWED_ALGORITHMS",
-            DEFAULT_JWT_ALLOWED_ALGORITHMS,
-        )
         self.encode_algorithm = app.config.get(
             "JWT_ALGORITHM",
             DEFAULT_JWT_ALGORITHM,
         )
+        codec_settings = dict(
+            json_codec=get_json_codec(
+                app.config.get("PRAETORIAN_JSON_CODEC", DEFAULT_JSON_CODEC),
+            ),
+            compression_threshold=app.config.get(
+                "JWT_COMPRESSION_THRESHOLD",
+                DEFAULT_JWT_COMPRESSION_THRESHOLD,
+            ),
+        )
+        if self.encode_algorithm in HMAC_DIGESTS:
+            self.encode_key = app.config["SECRET_KEY"]
+            self.decode_key = self.encode_key
+            self.allowed_algorithms = app.config.get(
+                "JWT_ALLOWED_ALGORITHMS",
+                DEFAULT_JWT_ALLOWED_ALGORITHMS,
+            )
+            self.jwt_codec = HMACJWTCodec(self.encode_key, **codec_settings)
+        else:
+            (self.encode_key, self.decode_key) = load_jwt_keys(
+                self.encode_algorithm,
+                private_key=app.config.get("JWT_PRIVATE_KEY"),
+                public_key=app.config.get("JWT_PUBLIC_KEY"),
+            )
+            self.allowed_algorithms = app.config.get(
+                "JWT_ALLOWED_ALGORITHMS",
+                [self.encode_algorithm],
+            )
+            ConfigurationError.require_condition(
+                set(self.allowed_algorithms).isdisjoint(HMAC_DIGESTS),
+                "JWT_ALLOWED_ALGORITHMS may not mix HMAC algorithms with {}".format(
+                    self.encode_algorithm
+                ),
+            )
+            self.jwt_codec = JWTCodec(**codec_settings)
         self.access_lifespan = app.config.get(
             "JWT_ACCESS_LIFESPAN",
             DEFAULT_JWT_ACCESS_LIFESPAN,
@@ -208,6 +394,68 @@ class Praetorian:
             "JWT_HEADER_TYPE",
             DEFAULT_JWT_HEADER_TYPE,
         )
+        self._header_pattern = re.compile(self.header_type + r"\s*([\w\.-]+)")
+        self.max_token_length = app.config.get(
+            "JWT_MAX_TOKEN_LENGTH",
+            DEFAULT_JWT_MAX_TOKEN_LENGTH,
+        )
+        self._jwt_prechecks = {
+            access_type: functools.partial(
+                self._precheck_jwt_data,
+                access_type=access_type,
+            )
+            for access_type in AccessType
+        }
+
+        self.token_mode = app.config.get(
+            "PRAETORIAN_TOKEN_MODE",
+            DEFAULT_TOKEN_MODE,
+        )
+        ConfigurationError.require_condition(
+            self.token_mode in TOKEN_MODES,
+            "PRAETORIAN_TOKEN_MODE must be one of {}".format(TOKEN_MODES),
+        )
+        if claim_store is None and self.token_mode == "opaque":
+            claim_store = MemoryClaimStore(
+                max_size=app.config.get(
+                    "PRAETORIAN_CLAIM_STORE_SIZE",
+                    DEFAULT_CLAIM_STORE_SIZE,
+                ),
+                clock=self.clock,
+            )
+        self.claim_store = claim_store
+
+        rotate_refresh_tokens = app.config.get(
+            "PRAETORIAN_ROTATE_REFRESH_TOKENS",
+            DEFAULT_ROTATE_REFRESH_TOKENS,
+        )
+        if refresh_family_store is None and rotate_refresh_tokens:
+            refresh_family_store = MemoryRefreshFamilyStore(
+                max_size=app.config.get(
+                    "PRAETORIAN_REFRESH_FAMILY_STORE_SIZE",
+                    DEFAULT_REFRESH_FAMILY_STORE_SIZE,
+                ),
+            )
+        self.refresh_families = refresh_family_store
+        self.refresh_reuse_grace = duration_to_seconds(
+            app.config.get(
+                "PRAETORIAN_REFRESH_REUSE_GRACE",
+                DEFAULT_REFRESH_REUSE_GRACE,
+            ),
+        )
+        self.rejected_tokens = None
+        rejected_token_cache_size = app.config.get(
+            "PRAETORIAN_REJECTED_TOKEN_CACHE_SIZE",
+            DEFAULT_REJECTED_TOKEN_CACHE_SIZE,
+        )
+        if rejected_token_cache_size:
+            self.rejected_tokens = RejectedTokenCache(rejected_token_cache_size)
+        self.rejected_token_ttl = duration_to_seconds(
+            app.config.get(
+                "PRAETORIAN_REJECTED_TOKEN_TTL",
+                DEFAULT_REJECTED_TOKEN_TTL,
+            ),
+        )
         self.user_class_validation_method = app.config.get(
             "USER_CLASS_VALIDATION_METHOD",
             DEFAULT_USER_CLASS_VALIDATION_METHOD,
@@ -251,8 +499,23 @@ class Praetorian:
             DEFAULT_JWT_ACCESS_LIFESPAN,
         )
 
+        self.template_cache_dir = app.config.get(
+            "PRAETORIAN_TEMPLATE_CACHE_DIR",
+        )
+        self._template_env = None
+
+        self.mail_backend = None
+        mail_backend = app.config.get("PRAETORIAN_MAIL_BACKEND")
+        if mail_backend is not None:
+            from flask_praetorian.mail import get_mail_backend
+
+            self.mail_backend = get_mail_backend(
+                mail_backend,
+                spool_dir=app.config.get("PRAETORIAN_MAIL_SPOOL_DIR"),
+            )
+
         if isinstance(self.access_lifespan, dict):
-            self.access_lifespan = pendulum.duration(**self.access_lifespan)
+            self.access_lifespan = duration_from_dict(self.access_lifespan)
         elif isinstance(self.access_lifespan, str):
             self.access_lifespan = duration_from_string(self.access_lifespan)
         ConfigurationError.require_condition(
@@ -261,7 +524,7 @@ class Praetorian:
         )
 
         if isinstance(self.refresh_lifespan, dict):
-            self.refresh_lifespan = pendulum.duration(**self.refresh_lifespan)
+            self.refresh_lifespan = duration_from_dict(self.refresh_lifespan)
         if isinstance(self.refresh_lifespan, str):
             self.refresh_lifespan = duration_from_string(self.refresh_lifespan)
         ConfigurationError.require_condition(
@@ -269,6 +532,11 @@ class Praetorian:
             "refresh lifespan was not configured",
         )
 
+        # Lifespans are converted once here so the token path only does
+        # integer arithmetic
+        self._access_lifespan_seconds = duration_to_seconds(self.access_lifespan)
+        self._refresh_lifespan_seconds = duration_to_seconds(self.refresh_lifespan)
+
         if not app.config.get("DISABLE_PRAETORIAN_ERROR_HANDLER"):
             app.register_error_handler(
                 PraetorianError,
@@ -279,10 +547,67 @@ class Praetorian:
 
         if not hasattr(app, "extensions"):
             app.extensions = {}
-        app.extensions["praetorian"] = self
+        app.extensions.setdefault("praetorian_guards", {})[self.name] = self
+        if self.name == DEFAULT_GUARD_NAME or DEFAULT_GUARD_NAME not in app.extensions:
+            app.extensions[DEFAULT_GUARD_NAME] = self
 
         return app
 
+    @property
+    def pwd_ctx(self):
+        """
+        The passlib password context used for hashing. If hashing is lazy,
+        the context is built the first time it is needed. If hashing is
+        disabled, this is None
+        """
+        if (
+            self._pwd_ctx is None
+            and self._pwd_ctx_settings is not None
+            and not self.hash_disabled
+        ):
+            self._pwd_ctx = self._build_pwd_ctx()
+        return self._pwd_ctx
+
+    @pwd_ctx.setter
+    def pwd_ctx(self, pwd_ctx):
+        self._pwd_ctx = pwd_ctx
+
+    def _build_pwd_ctx(self):
+        """
+        Builds the passlib password context from the settings gathered in
+        init_app
+        """
+        # passlib and the email dependencies are imported where they are first
+        # used so that importing flask_praetorian stays cheap
+        from passlib.context import CryptContext
+
+        pwd_ctx = CryptContext(**self._pwd_ctx_settings)
+
+        valid_schemes = pwd_ctx.schemes()
+        PraetorianError.require_condition(
+            self.hash_scheme in valid_schemes or self.hash_scheme is None,
+            "If {} is set, it must be one of the following schemes: {}".format(
+                "PRAETORIAN_HASH_SCHEME",
+                valid_schemes,
+            ),
+        )
+        return pwd_ctx
+
+    def _require_pwd_ctx(self):
+        """
+        Fetches the password context, making sure that hashing is available
+        """
+        ConfigurationError.require_condition(
+            not self.hash_disabled,
+            "Password hashing is disabled by PRAETORIAN_HASH_DISABLED",
+        )
+        pwd_ctx = self.pwd_ctx
+        PraetorianError.require_condition(
+            pwd_ctx is not None,
+            "Praetorian must be initialized before this method is available",
+        )
+        return pwd_ctx
+
     def _validate_user_class(self, app, user_class):
         """
         Validates the supplied user_class to make sure that it has the
@@ -321,7 +646,7 @@ class Praetorian:
         try:
             dummy_user = user_class()
         except Exception:
-            app.logger.debug(
+            logger.debug(
                 "Skipping instance validation because "
                 "user cannot be instantiated without arguments"
             )
@@ -367,11 +692,7 @@ class Praetorian:
         )
         user = self.user_class.lookup(username)
         AuthenticationError.require_condition(
-            user is not None
-            and self._verify_password(
-                password,
-                user.password,
-            ),
+            user is not None,
             "The username and/or password are incorrect",
         )
 
@@ -379,29 +700,93 @@ class Praetorian:
         If we are set to PRAETORIAN_HASH_AUTOUPDATE then check our hash
             and if needed, update the user.  The developer is responsible
             for using the returned user object and updating the data
-            storage endpoint.
+            storage endpoint, unless the guard has a password updater.
+            The password is verified and rehashed in a single pass, so a
+            legacy hash costs one verification.
 
         Else, if we are set to PRAETORIAN_HASH_AUTOTEST then check out hash
             and return exception if our hash is using the wrong scheme,
             but don't modify the user.
         """
         if self.hash_autoupdate:
-            self.verify_and_update(user=user, password=password)
-        elif self.hash_autotest:
+            with self._reserve_hash_memory(user.password, rehash=True):
+                (verified, updated) = self._require_pwd_ctx().verify_and_update(
+                    password,
+                    user.password,
+                )
+            AuthenticationError.require_condition(
+                verified,
+                "The username and/or password are incorrect",
+            )
+            if updated is not None:
+                self._store_updated_hash(user, updated)
+            return user
+
+        AuthenticationError.require_condition(
+            self._verify_password(password, user.password),
+            "The username and/or password are incorrect",
+        )
+        if self.hash_autotest:
             self.verify_and_update(user=user)
 
         return user
 
+    def auth_required(self, method):
+        """
+        Provides an ``@auth_required`` decorator that is bound to this guard.
+        The guard does not need to be looked up in the app for each request
+        """
+        return auth_required(method, guard=self)
+
+    def auth_accepted(self, method):
+        """
+        Provides an ``@auth_accepted`` decorator that is bound to this guard
+        """
+        return auth_accepted(method, guard=self)
+
+    def roles_required(self, *required_rolenames):
+        """
+        Provides a ``@roles_required`` decorator that is bound to this guard
+        """
+        return roles_required(*required_rolenames, guard=self)
+
+    def roles_accepted(self, *accepted_rolenames):
+        """
+        Provides a ``@roles_accepted`` decorator that is bound to this guard
+        """
+        return roles_accepted(*accepted_rolenames, guard=self)
+
     def _verify_password(self, raw_password, hashed_password):
         """
         Verifies that a plaintext password matches the hashed version of that
-        password using the stored passlib password context
+        password. Schemes that the direct hasher handles are verified without
+        the stored passlib password context
         """
-        PraetorianError.require_condition(
-            self.pwd_ctx is not None,
-            "Praetorian must be initialized before this method is available",
-        )
-        return self.pwd_ctx.verify(raw_password, hashed_password)
+        scheme = None
+        if self.direct_hasher is not None:
+            scheme = self.direct_hasher.identify(hashed_password)
+        pwd_ctx = self._require_pwd_ctx() if scheme is None else None
+        with self._reserve_hash_memory(hashed_password):
+            if scheme is not None:
+                return scheme.verify(raw_password, hashed_password)
+            return pwd_ctx.verify(raw_password, hashed_password)
+
+    def _reserve_hash_memory(self, hashed_password=None, rehash=False):
+        """
+        Reserves memory from the hash memory budget for verifying a hash. If
+        ``rehash`` is set, enough memory is also reserved for hashing with
+        the current scheme. Without a budget, nothing is reserved
+        """
+        if self.hash_memory_budget is None:
+            return contextlib.nullcontext()
+        cost = hash_memory_cost(hashed_password)
+        if rehash:
+            if self.direct_hasher is not None and self.direct_hasher.default:
+                scheme_cost = self.direct_hasher.default.memory_cost
+            else:
+                scheme_cost = scheme_memory_cost(self._require_pwd_ctx())
+            cost = max(cost, scheme_cost)
+        return self.hash_memory_budget.reserve(cost)
 
     @deprecated("Use `hash_password` instead.")
     def encrypt_password(self, raw_password):
@@ -486,32 +871,143 @@ class Praetorian:
         if not bypass_user_check:
             self._check_user(user)
 
-        moment = pendulum.now("UTC")
+        moment = self.clock()
+        (access_expiration, refresh_expiration) = self._compute_expirations(
+            moment,
+            override_access_lifespan,
+            override_refresh_lifespan,
+        )
+        if custom_claims and logger.isEnabledFor(logging.DEBUG):
+            claim_keys = sorted(custom_claims)
+            logger.debug(
+                "Attaching custom claims: %s",
+                claim_keys,
+                extra={"claim_keys": claim_keys},
+            )
+        payload_parts = self._build_payload_parts(
+            user,
+            moment,
+            access_expiration,
+            refresh_expiration,
+            custom_claims,
+            is_registration_token=is_registration_token,
+            is_reset_token=is_reset_token,
+        )
+
+        if self.encode_jwt_token_hook:
+            self.encode_jwt_token_hook(**payload_parts)
+        return self._issue_token(payload_parts)
+
+    def encode_jwt_tokens(
+        self,
+        users,
+        override_access_lifespan=None,
+        override_refresh_lifespan=None,
+        bypass_user_check=False,
+        max_workers=None,
+        **shared_claims,
+    ):
+        """
+        Encodes jwt tokens for many users at once. Useful for provisioning
+        service accounts or migrating users.
+
+        The shared claims are validated once and every token is issued at the
+        same moment. Returns a list of tokens in the same order as the users.
+        See ``encode_jwt_token()`` for the other parameters
+
+        :param: users:         An iterable of users to encode tokens for
+        :param: max_workers:   If set, tokens are signed by a pool of this many
+                               threads. This helps with algorithms whose
+                               signing releases the GIL, such as RSA and EC
+        :param: shared_claims: Additional claims that should be packed in the
+                               payload of every token
+        """
+        ClaimCollisionError.require_condition(
+            set(shared_claims.keys()).isdisjoint(RESERVED_CLAIMS),
+            "The custom claims collide with required claims",
+        )
+        users = list(users)
+        if not bypass_user_check:
+            for user in users:
+                self._check_user(user)
+
+        moment = self.clock()
+        (access_expiration, refresh_expiration) = self._compute_expirations(
+            moment,
+            override_access_lifespan,
+            override_refresh_lifespan,
+        )
+        if logger.isEnabledFor(logging.DEBUG):
+            claim_keys = sorted(shared_claims)
+            logger.debug(
+                "Encoding %d tokens with custom claims: %s",
+                len(users),
+                claim_keys,
+                extra={"claim_keys": claim_keys},
+            )
+        payloads = []
+        for user in users:
+            payload_parts = self._build_payload_parts(
+                user,
+                moment,
+                access_expiration,
+                refresh_expiration,
+                shared_claims,
+            )
+            if self.encode_jwt_token_hook:
+                self.encode_jwt_token_hook(**payload_parts)
+            payloads.append(payload_parts)
+
+        if max_workers is None or max_workers <= 1 or len(payloads) <= 1:
+            return [self._issue_token(p) for p in payloads]
 
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(self._issue_token, payloads))
+
+    def _compute_expirations(
+        self,
+        moment,
+        override_access_lifespan,
+        override_refresh_lifespan,
+    ):
+        """
+        Computes the access and refresh expiration timestamps for a token
+        issued at the given moment
+        """
         if override_refresh_lifespan is None:
-            refresh_lifespan = self.refresh_lifespan
-        elif isinstance(override_refresh_lifespan, dict):
-            refresh_lifespan = pendulum.duration(**override_refresh_lifespan)
+            refresh_lifespan = self._refresh_lifespan_seconds
         else:
-            refresh_lifespan = override_refresh_lifespan
-        refresh_expiration = (moment + refresh_lifespan).int_timestamp
+            refresh_lifespan = duration_to_seconds(override_refresh_lifespan)
+        refresh_expiration = moment + refresh_lifespan
 
         if override_access_lifespan is None:
-            access_lifespan = self.access_lifespan
-        elif isinstance(override_access_lifespan, dict):
-            access_lifespan = pendulum.duration(**override_access_lifespan)
+            access_lifespan = self._access_lifespan_seconds
         else:
-            access_lifespan = override_access_lifespan
-        access_expiration = min(
-            (moment + access_lifespan).int_timestamp,
-            refresh_expiration,
-        )
+            access_lifespan = duration_to_seconds(override_access_lifespan)
+        access_expiration = min(moment + access_lifespan, refresh_expiration)
+        return (access_expiration, refresh_expiration)
 
+    def _build_payload_parts(
+        self,
+        user,
+        moment,
+        access_expiration,
+        refresh_expiration,
+        custom_claims,
+        is_registration_token=False,
+        is_reset_token=False,
+    ):
+        """
+        Builds the payload for a new token. The custom claims must already be
+        checked for collisions with the reserved claims
+        """
         payload_parts = {
-            "iat": moment.int_timestamp,
+            "iat": moment,
             "exp": access_expiration,
             "jti": str(uuid.uuid4()),
-            "id": user.identity if is_jsonable(user.identity) else str(user.identity),
+            "id": identity_claim(user.identity),
             "rls": ",".join(user.rolenames),
             REFRESH_EXPIRATION_CLAIM: refresh_expiration,
         }
@@ -519,18 +1015,16 @@ class Praetorian:
             payload_parts[IS_REGISTRATION_TOKEN_CLAIM] = True
         if is_reset_token:
             payload_parts[IS_RESET_TOKEN_CLAIM] = True
-        flask.current_app.logger.debug(
-            "Attaching custom claims: {}".format(custom_claims),
-        )
+        if self.name != DEFAULT_GUARD_NAME:
+            payload_parts[GUARD_NAME_CLAIM] = self.name
+        if self.refresh_families is not None and not (
+            is_registration_token or is_reset_token
+        ):
+            jti = payload_parts["jti"]
+            payload_parts[REFRESH_FAMILY_CLAIM] = jti
+            self.refresh_families.start(jti, jti, moment, refresh_expiration)
         payload_parts.update(custom_claims)
-
-        if self.encode_jwt_token_hook:
-            self.encode_jwt_token_hook(**payload_parts)
-        return jwt.encode(
-            payload_parts,
-            self.encode_key,
-            self.encode_algorithm,
-        )
+        return payload_parts
 
     def encode_eternal_jwt_token(self, user, **custom_claims):
         """
@@ -565,138 +1059,283 @@ class Praetorian:
                                            accessibility will expire. May not
                                            exceed the refresh lifespan
         """
-        moment = pendulum.now("UTC")
+        moment = self.clock()
         data = self.extract_jwt_token(token, access_type=AccessType.refresh)
 
         user = self.user_class.identify(data["id"])
         self._check_user(user)
 
         if override_access_lifespan is None:
-            access_lifespan = self.access_lifespan
-        elif isinstance(override_access_lifespan, dict):
-            access_lifespan = pendulum.duration(**override_access_lifespan)
+            access_lifespan = self._access_lifespan_seconds
         else:
-            access_lifespan = override_access_lifespan
+            access_lifespan = duration_to_seconds(override_access_lifespan)
         refresh_expiration = data[REFRESH_EXPIRATION_CLAIM]
-        access_expiration = min(
-            (moment + access_lifespan).int_timestamp,
-            refresh_expiration,
-        )
+        access_expiration = min(moment + access_lifespan, refresh_expiration)
 
         custom_claims = {k: v for (k, v) in data.items() if k not in RESERVED_CLAIMS}
         payload_parts = {
-            "iat": moment.int_timestamp,
+            "iat": moment,
             "exp": access_expiration,
             "jti": data["jti"],
             "id": data["id"],
             "rls": ",".join(user.rolenames),
             REFRESH_EXPIRATION_CLAIM: refresh_expiration,
         }
+        if self.name != DEFAULT_GUARD_NAME:
+            payload_parts[GUARD_NAME_CLAIM] = self.name
+        if self.refresh_families is not None:
+            family = data.get(REFRESH_FAMILY_CLAIM, data["jti"])
+            payload_parts["jti"] = str(uuid.uuid4())
+            payload_parts[REFRESH_FAMILY_CLAIM] = family
         payload_parts.update(custom_claims)
 
         if self.refresh_jwt_token_hook:
             self.refresh_jwt_token_hook(**payload_parts)
-        return jwt.encode(
+        if self.refresh_families is not None:
+            # Rotate last, so that a failure while refreshing leaves the old
+            # token current and the client may retry with it. Only tokens
+            # issued before rotation was enabled lack a family. A token that
+            # has one must belong to a family the store knows
+            jti = self.refresh_families.rotate(
+                family,
+                data["jti"],
+                payload_parts["jti"],
+                moment,
+                self.refresh_reuse_grace,
+                refresh_expiration,
+                adopt=REFRESH_FAMILY_CLAIM not in data,
+            )
+            if jti is None:
+                raise RefreshTokenReused(
+                    "Token was already refreshed or its family is unknown. "
+                    "Its family has been revoked"
+                )
+            payload_parts["jti"] = jti
+        new_token = self._issue_token(payload_parts)
+        if self._is_opaque_token(token):
+            self.claim_store.delete(token)
+        return new_token
+
+    def _issue_token(self, payload_parts):
+        """
+        Turns a payload into a token. In opaque token mode, the payload is
+        kept in the claim store under a new random token. Otherwise, the
+        payload is signed into a jwt
+        """
+        if self.token_mode == "opaque":
+            token = secrets.token_urlsafe(DEFAULT_OPAQUE_TOKEN_BYTES)
+            self.claim_store.put(
+                token,
+                payload_parts,
+                payload_parts[REFRESH_EXPIRATION_CLAIM],
+            )
+            return token
+        if self.encode_key is None:
+            raise ConfigurationError("JWT_PRIVATE_KEY must be set to issue tokens")
+        return self.jwt_codec.encode(
             payload_parts,
             self.encode_key,
             self.encode_algorithm,
         )
 
+    def _is_opaque_token(self, token):
+        """
+        Checks if a token should be resolved through the claim store. A jwt
+        always contains dots, and an opaque token never does
+        """
+        return self.claim_store is not None and "." not in token
+
     def extract_jwt_token(self, token, access_type=AccessType.access):
         """
-        Extracts a data dictionary from a jwt token
+        Extracts a data dictionary from a jwt token. If the guard has a claim
+        store, opaque tokens are resolved with a single lookup in it.
+
+        Tokens that are too long or malformed, and jwts whose unverified
+        claims show that they have expired, are rejected before their
+        signature is verified.
+
+        If PRAETORIAN_REJECTED_TOKEN_CACHE_SIZE is set, rejected tokens are
+        remembered for PRAETORIAN_REJECTED_TOKEN_TTL seconds and rejected
+        again with the same error without being decoded. Tokens refreshed too
+        early are not remembered because they become valid for refresh later
+        """
+        self._check_token_length(token)
+        is_opaque = self._is_opaque_token(token)
+        if not is_opaque and token.count(".") != 2:
+            raise InvalidTokenHeader(
+                "failed to decode JWT token -- a jwt must have three segments"
+            )
+        if self.rejected_tokens is None:
+            return self._extract_jwt_data(token, access_type, is_opaque)
+
+        key = (
+            hashlib.blake2b(token.encode("utf-8"), digest_size=16).digest(),
+            access_type,
+        )
+        moment = self.clock()
+        rejection = self.rejected_tokens.get(key, moment)
+        if rejection is not None:
+            (exc_class, message) = rejection
+            raise exc_class(message)
+        try:
+            return self._extract_jwt_data(token, access_type, is_opaque)
+        except EarlyRefreshError:
+            raise
+        except PraetorianError as err:
+            self.rejected_tokens.put(
+                key,
+                type(err),
+                err.message,
+                moment + self.rejected_token_ttl,
+            )
+            raise
+
+    def _extract_jwt_data(self, token, access_type, is_opaque):
+        """
+        Decodes and validates a token that is not known to be rejected
         """
-        # Note: we disable exp verification because we will do it ourselves
-        with InvalidTokenHeader.handle_errors("failed to decode JWT token"):
-            data = jwt.decode(
+        if is_opaque:
+            data = self.claim_store.get(token)
+            if data is None:
+                raise InvalidTokenHeader(
+                    "failed to resolve opaque token -- not found in claim store"
+                )
+            self._validate_jwt_data(data, access_type=access_type)
+            return data
+
+        # Note: the codec skips exp verification because we will do it ourselves
+        try:
+            data = self.jwt_codec.decode(
                 token,
-                self.encode_key,
-                algorithms=self.allowed_algorithms,
-                options={"verify_exp": False},
+                self.decode_key,
+                self.allowed_algorithms,
+                precheck=self._jwt_prechecks[access_type],
             )
+        except PraetorianError:
+            raise
+        except Exception as err:
+            raise InvalidTokenHeader(
+                "failed to decode JWT token -- {}: {}".format(type(err).__name__, err)
+            ) from err
         self._validate_jwt_data(data, access_type=access_type)
         return data
 
-    def _validate_jwt_data(self, data, access_type):
+    def _check_token_length(self, token):
         """
-        Validates that the data for a jwt token is valid
+        Rejects tokens longer than JWT_MAX_TOKEN_LENGTH
         """
-        MissingClaimError.require_condition(
-            "jti" in data,
-            "Token is missing jti claim",
-        )
-        BlacklistedError.require_condition(
-            not self.is_blacklisted(data["jti"]),
-            "Token has a blacklisted jti",
-        )
-        MissingClaimError.require_condition(
-            "id" in data,
-            "Token is missing id field",
-        )
-        MissingClaimError.require_condition(
-            "exp" in data,
-            "Token is missing exp claim",
-        )
-        MissingClaimError.require_condition(
-            REFRESH_EXPIRATION_CLAIM in data,
-            "Token is missing {} claim".format(REFRESH_EXPIRATION_CLAIM),
-        )
-        moment = pendulum.now("UTC").int_timestamp
-        if access_type == AccessType.access:
-            MisusedRegistrationToken.require_condition(
-                IS_REGISTRATION_TOKEN_CLAIM not in data,
-                "registration token used for access",
+        if self.max_token_length is not None and len(token) > self.max_token_length:
+            raise InvalidTokenHeader(
+                "token is longer than {} characters".format(self.max_token_length)
             )
-            MisusedResetToken.require_condition(
-                IS_RESET_TOKEN_CLAIM not in data,
-                "password reset token used for access",
+
+    def _precheck_jwt_data(self, data, access_type):
+        """
+        Rejects a jwt whose unverified claims show that it has expired for the
+        access type. This runs before the signature is verified, so it may
+        only reject tokens. Anything it lets through is validated again by
+        ``_validate_jwt_data()`` once the signature has been verified
+        """
+        moment = self.clock()
+        if access_type == AccessType.refresh:
+            refresh_expiration = data.get(REFRESH_EXPIRATION_CLAIM)
+            if type(refresh_expiration) is int and moment > refresh_expiration:
+                raise ExpiredRefreshError("refresh permission for token has expired")
+            return
+        expiration = data.get("exp")
+        if type(expiration) is int and moment > expiration:
+            raise ExpiredAccessError(
+                "{} permission has expired".format(access_type.name)
             )
-            ExpiredAccessError.require_condition(
-                moment <= data["exp"],
-                "access permission has expired",
+
+    def _validate_jwt_data(self, data, access_type):
+        """
+        Validates that the data for a jwt token is valid
+
+        This is called for every authenticated request, so the checks are
+        written as plain conditionals. Exceptions and their messages are only
+        constructed when a check fails
+        """
+        if "jti" not in data:
+            raise MissingClaimError("Token is missing jti claim")
+        if self.is_blacklisted(data["jti"]):
+            raise BlacklistedError("Token has a blacklisted jti")
+        if "id" not in data:
+            raise MissingClaimError("Token is missing id field")
+        if "exp" not in data:
+            raise MissingClaimError("Token is missing exp claim")
+        if REFRESH_EXPIRATION_CLAIM not in data:
+            raise MissingClaimError(
+                "Token is missing {} claim".format(REFRESH_EXPIRATION_CLAIM)
             )
+        if data.get(GUARD_NAME_CLAIM, DEFAULT_GUARD_NAME) != self.name:
+            raise MisusedGuardToken("Token was issued by a different guard")
+        if (
+            self.refresh_families is not None
+            and REFRESH_FAMILY_CLAIM in data
+            and self.refresh_families.is_revoked(data[REFRESH_FAMILY_CLAIM])
+        ):
+            raise BlacklistedError("Token belongs to a revoked refresh family")
+        moment = self.clock()
+        if "iat" in data and not (type(data["iat"]) is int and data["iat"] <= moment):
+            self._validate_time_claim(data, "iat", moment)
+        if "nbf" in data:
+            self._validate_time_claim(data, "nbf", moment)
+        if data.get("aud"):
+            raise InvalidTokenHeader("failed to decode JWT token -- Invalid audience")
+        if access_type == AccessType.access:
+            if IS_REGISTRATION_TOKEN_CLAIM in data:
+                raise MisusedRegistrationToken("registration token used for access")
+            if IS_RESET_TOKEN_CLAIM in data:
+                raise MisusedResetToken("password reset token used for access")
+            if moment > data["exp"]:
+                raise ExpiredAccessError("access permission has expired")
         elif access_type == AccessType.refresh:
-            MisusedRegistrationToken.require_condition(
-                IS_REGISTRATION_TOKEN_CLAIM not in data,
-                "registration token used for refresh",
-            )
-            MisusedResetToken.require_condition(
-                IS_RESET_TOKEN_CLAIM not in data,
-                "password reset token used for refresh",
-            )
-            EarlyRefreshError.require_condition(
-                moment > data["exp"],
-                "access permission for token has not expired. may not refresh",
-            )
-            ExpiredRefreshError.require_condition(
-                moment <= data[REFRESH_EXPIRATION_CLAIM],
-                "refresh permission for token has expired",
-            )
+            if IS_REGISTRATION_TOKEN_CLAIM in data:
+                raise MisusedRegistrationToken("registration token used for refresh")
+            if IS_RESET_TOKEN_CLAIM in data:
+                raise MisusedResetToken("password reset token used for refresh")
+            if moment <= data["exp"]:
+                raise EarlyRefreshError(
+                    "access permission for token has not expired. may not refresh"
+                )
+            if moment > data[REFRESH_EXPIRATION_CLAIM]:
+                raise ExpiredRefreshError("refresh permission for token has expired")
         elif access_type == AccessType.register:
-            ExpiredAccessError.require_condition(
-                moment <= data["exp"],
-                "register permission has expired",
-            )
-            InvalidRegistrationToken.require_condition(
-                IS_REGISTRATION_TOKEN_CLAIM in data,
-                "invalid registration token used for verification",
-            )
-            MisusedResetToken.require_condition(
-                IS_RESET_TOKEN_CLAIM not in data,
-                "password reset token used for registration",
-            )
+            if moment > data["exp"]:
+                raise ExpiredAccessError("register permission has expired")
+            if IS_REGISTRATION_TOKEN_CLAIM not in data:
+                raise InvalidRegistrationToken(
+                    "invalid registration token used for verification"
+                )
+            if IS_RESET_TOKEN_CLAIM in data:
+                raise MisusedResetToken("password reset token used for registration")
         elif access_type == AccessType.reset:
-            MisusedRegistrationToken.require_condition(
-                IS_REGISTRATION_TOKEN_CLAIM not in data,
-                "registration token used for reset",
-            )
-            ExpiredAccessError.require_condition(
-                moment <= data["exp"],
-                "reset permission has expired",
+            if IS_REGISTRATION_TOKEN_CLAIM in data:
+                raise MisusedRegistrationToken("registration token used for reset")
+            if moment > data["exp"]:
+                raise ExpiredAccessError("reset permission has expired")
+            if IS_RESET_TOKEN_CLAIM not in data:
+                raise InvalidResetToken("invalid reset token used for verification")
+
+    def _validate_time_claim(self, data, claim, moment):
+        """
+        Validates that a registered time claim, such as ``iat`` or ``nbf``, is
+        an integer that is not in the future
+        """
+        try:
+            value = int(data[claim])
+        except (TypeError, ValueError):
+            raise InvalidTokenHeader(
+                "failed to decode JWT token -- {} claim must be an integer".format(
+                    claim
+                )
             )
-            InvalidResetToken.require_condition(
-                IS_RESET_TOKEN_CLAIM in data,
-                "invalid reset token used for verification",
+        if value > moment:
+            raise InvalidTokenHeader(
+                "failed to decode JWT token -- The token is not yet valid ({})".format(
+                    claim
+                )
             )
 
     def _unpack_header(self, headers):
@@ -704,19 +1343,16 @@ class Praetorian:
         Unpacks a jwt token from a request header
         """
         jwt_header = headers.get(self.header_name)
-        MissingToken.require_condition(
-            jwt_header is not None,
-            "JWT token not found in headers under '{}'".format(
-                self.header_name,
-            ),
-        )
+        if jwt_header is None:
+            raise MissingToken(
+                "JWT token not found in headers under '{}'".format(self.header_name)
+            )
 
-        match = re.match(self.header_type + r"\s*([\w\.-]+)", jwt_header)
-        InvalidTokenHeader.require_condition(
-            match is not None,
-            "JWT header structure is invalid",
-        )
+        match = self._header_pattern.match(jwt_header)
+        if match is None:
+            raise InvalidTokenHeader("JWT header structure is invalid")
         token = match.group(1)
+        self._check_token_length(token)
         return token
 
     def read_token_from_header(self):
@@ -730,10 +1366,11 @@ class Praetorian:
         Unpacks a jwt token from a request cookies
         """
         jwt_cookie = cookies.get(self.cookie_name)
-        MissingToken.require_condition(
-            jwt_cookie is not None,
-            "JWT token not found in cookie under '{}'".format(self.cookie_name),
-        )
+        if jwt_cookie is None:
+            raise MissingToken(
+                "JWT token not found in cookie under '{}'".format(self.cookie_name)
+            )
+        self._check_token_length(jwt_cookie)
         return jwt_cookie
 
     def read_token_from_cookie(self):
@@ -760,25 +1397,56 @@ class Praetorian:
             except MissingToken:
                 pass
             except AttributeError:
-                flask.current_app.logger.warning(
-                    textwrap.dedent(
-                        f"""
-                        Flask_Praetorian hasn't implemented reading JWT tokens
-                        from location {place.lower()}.
-                        Please reconfigure JWT_PLACES.
-                        Values accepted in JWT_PLACES are:
-                        {DEFAULT_JWT_PLACES}
-                        """
-                    )
-                )
+                self._warn_unknown_place(place)
 
         raise MissingToken(
+            "Could not find token in any of the given locations: {}".format(
+                self.jwt_places,
+            )
+        )
+
+    def probe_token(self):
+        """
+        Looks for a token in the current flask request in the locations
+        configured by JWT_PLACES. Unlike ``read_token()``, returns None when
+        no token is present instead of raising an exception, which makes
+        requests without a token cheap on routes where authentication is
+        optional. A token that is present but malformed still raises
+        """
+        request = flask.request
+        for place in self.jwt_places:
+            place = place.lower()
+            if place == "header":
+                if self.header_name in request.headers:
+                    return self._unpack_header(request.headers)
+            elif place == "cookie":
+                if self.cookie_name in request.cookies:
+                    return self._unpack_cookie(request.cookies)
+            else:
+                reader = getattr(self, "read_token_from_{}".format(place), None)
+                if reader is None:
+                    self._warn_unknown_place(place)
+                    continue
+                try:
+                    return reader()
+                except MissingToken:
+                    pass
+        return None
+
+    def _warn_unknown_place(self, place):
+        """
+        Warns that JWT_PLACES names a location tokens cannot be read from
+        """
+        logger.warning(
             textwrap.dedent(
                 f"""
-                Could not find token in any
-                 of the given locations: {self.jwt_places}
+                Flask_Praetorian hasn't implemented reading JWT tokens
+                from location {place.lower()}.
+                Please reconfigure JWT_PLACES.
+                Values accepted in JWT_PLACES are:
+                {DEFAULT_JWT_PLACES}
                 """
-            ).replace("\n", "")
+            )
         )
 
     def pack_header_for_user(
@@ -832,8 +1500,7 @@ class Praetorian:
             is_registration_token=True,
         )
 
-        with open(self.confirmation_template) as fh:
-            template = fh.read()
+        template = self.get_email_template(self.confirmation_template)
 
         return self.send_token_email(
             email,
@@ -861,8 +1528,7 @@ class Praetorian:
             is_reset_token=True,
         )
 
-        with open(self.reset_template) as fh:
-            template = fh.read()
+        template = self.get_email_template(self.reset_template)
 
         return self.send_token_email(
             email=email,
@@ -873,6 +1539,35 @@ class Praetorian:
             custom_token=custom_token,
         )
 
+    def _get_template_env(self):
+        """
+        Fetches the jinja2 environment used to compile email templates. The
+        environment keeps compiled templates cached and is built on first use
+        """
+        if self._template_env is None:
+            import jinja2
+
+            bytecode_cache = None
+            if self.template_cache_dir is not None:
+                bytecode_cache = jinja2.FileSystemBytecodeCache(
+                    self.template_cache_dir,
+                )
+            self._template_env = jinja2.Environment(
+                loader=jinja2.FunctionLoader(_load_template_file),
+                auto_reload=True,
+                bytecode_cache=bytecode_cache,
+            )
+        return self._template_env
+
+    def get_email_template(self, path):
+        """
+        Fetches a compiled jinja2 template for an email template file. The
+        template is only read and compiled again if the file is modified
+
+        :param: path: The path to the template file
+        """
+        return self._get_template_env().get_template(path)
+
     def send_token_email(
         self,
         email,
@@ -888,12 +1583,17 @@ class Praetorian:
         with a `mail` extension, which supports Flask-Mail's `Message()` object and a
         `send()` method.
 
+        If the guard has an email dispatcher, the email is handed to it instead of
+        being sent before this method returns. The ``result`` in the returned dict
+        is then only set once the email is sent.
+
         Returns a dict containing the information sent
 
         :param: email:         The email address to which the message should be sent
         :param: template:      HTML Template for confirmation email.
-                               If not provided, a stock entry is
-                               used
+                               May be a template string or a compiled
+                               jinja2 Template such as those provided by
+                               ``get_email_template()``
         :param: action_sender: The sender that should be attached
                                to the confirmation email.
         :param: action_uri:    The uri that should be visited to
@@ -902,12 +1602,47 @@ class Praetorian:
         :param: custom_token:  The token to be carried as the
                                email's payload
         """
+        (notification, msg) = self._build_token_email(
+            email,
+            template,
+            action_sender,
+            action_uri,
+            subject,
+            custom_token,
+        )
+
+        if self.email_dispatcher is not None:
+            logger.debug("Dispatching email to %s", email)
+            self.email_dispatcher.dispatch(notification, msg)
+            return notification
+
+        with PraetorianError.handle_errors('Failed to send token-bearking email'):
+            logger.debug("Sending email to %s", email)
+            msg.send(msg)
+
+        return notification
+
+    def _build_token_email(
+        self,
+        email,
+        template,
+        action_sender,
+        action_uri,
+        subject,
+        custom_token,
+    ):
+        """
+        Renders a token bearing email. Returns the notification dict and the
+        message that is ready to be sent. See ``send_token_email()`` for the
+        parameters
+        """
         PraetorianError.require_condition(
             custom_token,
             "A custom_token is required to send notification email",
         )
         notification = {
             'result': None,
+            'error': None,
             'message': None,
             'email': email,
             'token': custom_token,
@@ -917,7 +1652,8 @@ class Praetorian:
         }
 
         PraetorianError.require_condition(
-            "mailman" in flask.current_app.extensions,
+            self.mail_backend is not None
+            or "mailman" in flask.current_app.extensions,
             "Your app must have a mail extension enabled to register by email",
         )
 
@@ -931,8 +1667,13 @@ class Praetorian:
             "A template is required to send a token bearing email",
         )
 
-        with PraetorianError.handle_errors('Failed to send token-bearking email'):
-            jinja_tmpl = jinja2.Template(template)
+        from flask_mailman import EmailMessage
+
+        with PraetorianError.handle_errors('Failed to build token-bearing email'):
+            if isinstance(template, str):
+                jinja_tmpl = self._get_template_env().from_string(template)
+            else:
+                jinja_tmpl = template
             notification["message"] = jinja_tmpl.render(notification).strip()
 
             msg = EmailMessage(
@@ -940,13 +1681,132 @@ class Praetorian:
                 notification["message"],
                 action_sender,
                 [notification["email"]],
+                connection=self.mail_backend,
             )
-
-            flask.current_app.logger.debug("Sending email to {}".format(email))
             msg.content_subtype = "html"
-            msg.send(msg)
 
-        return notification
+        return (notification, msg)
+
+    def _build_token_emails(self, pairs, make_token, **kwargs):
+        """
+        Mints a token for each (email, user) pair with ``make_token`` and
+        renders its email. A pair that fails keeps its place in the batch
+        without a message: its notification's ``result`` is False and
+        ``error`` describes the failure. See ``_build_token_email()`` for the
+        remaining parameters
+        """
+        emails = []
+        for (email, user) in pairs:
+            try:
+                emails.append(
+                    self._build_token_email(
+                        email,
+                        custom_token=make_token(user),
+                        **kwargs,
+                    )
+                )
+            except PraetorianError as err:
+                notification = {
+                    'result': False,
+                    'error': "{}: {}".format(type(err).__name__, err),
+                    'message': None,
+                    'email': email,
+                    'token': None,
+                    'subject': kwargs["subject"],
+                    'confirmation_uri': kwargs["action_uri"],
+                    'action_uri': kwargs["action_uri"],
+                }
+                emails.append((notification, None))
+        return emails
+
+    def _send_token_emails(self, emails):
+        """
+        Sends a batch of rendered token bearing emails over a single mail
+        connection. A failure to send one message does not stop the rest.
+
+        Returns the notification dicts in the order they were supplied. The
+        ``result`` of each is True if the message was sent. Otherwise, it is
+        False and ``error`` describes the failure
+
+        :param: emails: A list of (notification, message) pairs as provided by
+                        ``_build_token_emails()``. Pairs without a message
+                        are skipped
+        """
+        with PraetorianError.handle_errors('Failed to open mail connection'):
+            connection = self.mail_backend
+            if connection is None:
+                connection = flask.current_app.extensions["mailman"].get_connection()
+            connection.open()
+        try:
+            for (notification, msg) in emails:
+                if msg is None:
+                    continue
+                logger.debug("Sending email to %s", notification["email"])
+                try:
+                    notification["result"] = connection.send_messages([msg]) == 1
+                except Exception as err:
+                    notification["result"] = False
+                    notification["error"] = "{}: {}".format(type(err).__name__, err)
+        finally:
+            connection.close()
+        return [notification for (notification, _) in emails]
+
+    def send_registration_emails(self, pairs):
+        """
+        Sends registration emails to many new users over a single mail
+        connection. See ``send_registration_email()``
+
+        Returns a list of dicts containing the information sent to each
+        recipient, in order. A recipient whose token or email can not be
+        built is reported without stopping the rest. See
+        ``_send_token_emails()`` for the results
+
+        :param: pairs: An iterable of (email, user) pairs
+        """
+        template = self.get_email_template(self.confirmation_template)
+        return self._send_token_emails(
+            self._build_token_emails(
+                pairs,
+                lambda user: self.encode_jwt_token(
+                    user,
+                    override_access_lifespan=self.confirmation_lifespan,
+                    bypass_user_check=True,
+                    is_registration_token=True,
+                ),
+                template=template,
+                action_sender=self.confirmation_sender,
+                action_uri=self.confirmation_uri,
+                subject=self.confirmation_subject,
+            )
+        )
+
+    def send_reset_emails(self, pairs):
+        """
+        Sends password reset emails to many users over a single mail
+        connection. See ``send_reset_email()``
+
+        Returns a list of dicts containing the information sent to each
+        recipient, in order. A recipient whose token or email can not be
+        built is reported without stopping the rest. See
+        ``_send_token_emails()`` for the results
+
+        :param: pairs: An iterable of (email, user) pairs
+        """
+        template = self.get_email_template(self.reset_template)
+        return self._send_token_emails(
+            self._build_token_emails(
+                pairs,
+                lambda user: self.encode_jwt_token(
+                    user,
+                    override_access_lifespan=self.reset_lifespan,
+                    is_reset_token=True,
+                ),
+                template=template,
+                action_sender=self.reset_sender,
+                action_uri=self.reset_uri,
+                subject=self.reset_subject,
+            )
+        )
 
     def get_user_from_registration_token(self, token):
         """
@@ -988,18 +1848,59 @@ class Praetorian:
 
     def hash_password(self, raw_password):
         """
-        Hashes a plaintext password using the stored passlib password context
+        Hashes a plaintext password using the stored passlib password context.
+        If the direct hasher handles the current scheme, it is used instead
         """
-        PraetorianError.require_condition(
-            self.pwd_ctx is not None,
-            "Praetorian must be initialized before this method is available",
-        )
+        if self.direct_hasher is not None and self.direct_hasher.default:
+            with self._reserve_hash_memory(rehash=True):
+                return self.direct_hasher.default.hash(raw_password)
+        pwd_ctx = self._require_pwd_ctx()
         """
         `scheme` is now set with self.pwd_ctx.update(default=scheme) due
             to the depreciation in upcoming passlib 2.0.
          zillions of warnings suck.
         """
-        return self.pwd_ctx.hash(raw_password)
+        with self._reserve_hash_memory(rehash=True):
+            return pwd_ctx.hash(raw_password)
+
+    def hash_passwords(self, raw_passwords, max_workers=None, chunk_size=16):
+        """
+        Hashes many plaintext passwords in a pool of processes. Useful for
+        bulk user imports.
+
+        Returns an iterator that yields the hashes in the same order as the
+        passwords. Passwords are read from the iterable as the hashes are
+        consumed, so large imports can be streamed. Worker processes do not
+        share the guard's hash memory budget, but each hashes one password
+        at a time
+
+        :param: raw_passwords: An iterable of plaintext passwords
+        :param: max_workers:   The number of processes. Defaults to the
+                               number of cpus. If 1, passwords are hashed in
+                               this process
+        :param: chunk_size:    The number of passwords sent to a process at
+                               once
+        """
+        if max_workers == 1:
+            return (self.hash_password(raw_password) for raw_password in raw_passwords)
+        self._require_pwd_ctx()
+        return hash_passwords(
+            raw_passwords,
+            self._pwd_ctx_settings,
+            direct=self.direct_hasher is not None,
+            max_workers=max_workers,
+            chunk_size=chunk_size,
+        )
+
+    def _store_updated_hash(self, user, hashed_password):
+        """
+        Hands an upgraded hash to the password updater. Without one, the hash
+        is assigned to the user for the app to save
+        """
+        if self.password_updater is not None:
+            self.password_updater.update(user, hashed_password)
+        else:
+            user.password = hashed_password
 
     def verify_and_update(self, user=None, password=None):
         """
@@ -1020,19 +1921,21 @@ class Praetorian:
                               and then attempt to update with the
                               new PRAETORIAN_HASH_SCHEME scheme.
         """
-        if self.pwd_ctx.needs_update(user.password):
+        pwd_ctx = self._require_pwd_ctx()
+        if pwd_ctx.needs_update(user.password):
             if password:
-                (rv, updated) = self.pwd_ctx.verify_and_update(
-                    password,
-                    user.password,
-                )
+                with self._reserve_hash_memory(user.password, rehash=True):
+                    (rv, updated) = pwd_ctx.verify_and_update(
+                        password,
+                        user.password,
+                    )
                 AuthenticationError.require_condition(
                     rv,
                     "Could not verify password",
                 )
-                user.password = updated
+                self._store_updated_hash(user, updated)
             else:
-                used_hash = self.pwd_ctx.identify(user.password)
+                used_hash = pwd_ctx.identify(user.password)
                 desired_hash = self.hash_scheme
                 raise LegacyScheme(
                     "Hash using non-current scheme '{}'." "Use '{}' instead.".format(
@@ -0,0 +1,343 @@
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+import zlib
+
+import jwt
+import jwt.algorithms
+from jwt import api_jws
+
+from flask_praetorian.exceptions import ConfigurationError
+
+
+COMPRESSION_HEADER = "zip"
+DEFLATE = "DEF"
+
+
+def deflate(data):
+    """
+    Compresses bytes with raw deflate as used by the ``zip`` header convention
+    """
+    compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def inflate(data):
+    """
+    Decompresses bytes that were compressed with ``deflate()``
+    """
+    return zlib.decompress(data, wbits=-zlib.MAX_WBITS)
+
+
+def base64url_encode(data):
+    """
+    Encodes bytes with unpadded base64url as used in jwt segments
+    """
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+
+def base64url_decode(data):
+    """
+    Decodes an unpadded base64url jwt segment
+    """
+    return base64.urlsafe_b64decode(data + b"=" * (-len(data) % 4))
+
+
+class JSONCodec:
+    """
+    Serializes token payloads with the standard library's json module
+    """
+
+    def dumps(self, payload):
+        """
+        Serializes a payload to compact JSON bytes
+        """
+        return json.dumps(payload, separators=(",", ":")).encode("utf-8")
+
+    def loads(self, data):
+        """
+        Deserializes JSON bytes. Raises a ValueError if they are not valid
+        """
+        return json.loads(data)
+
+
+class OrjsonCodec(JSONCodec):
+    """
+    Serializes token payloads with orjson, which is much faster than the
+    standard library. Requires the orjson package
+    """
+
+    def __init__(self):
+        import orjson
+
+        self._orjson = orjson
+        self._option = orjson.OPT_NON_STR_KEYS
+
+    def dumps(self, payload):
+        return self._orjson.dumps(payload, option=self._option)
+
+    def loads(self, data):
+        return self._orjson.loads(data)
+
+
+def get_json_codec(name):
+    """
+    Builds the JSON codec selected by name
+
+    :param: name: ``"json"`` for the standard library, ``"orjson"`` for orjson
+                  or ``"auto"`` for orjson if it is installed and the standard
+                  library otherwise
+    """
+    if name == "json":
+        return JSONCodec()
+    if name == "auto":
+        try:
+            return OrjsonCodec()
+        except ImportError:
+            return JSONCodec()
+    if name == "orjson":
+        with ConfigurationError.handle_errors(
+            "The orjson package must be installed to use the orjson codec",
+            handle_exc_class=ImportError,
+        ):
+            return OrjsonCodec()
+    raise ConfigurationError(
+        "PRAETORIAN_JSON_CODEC must be 'json', 'orjson' or 'auto', not {!r}".format(
+            name
+        )
+    )
+
+
+def load_jwt_keys(algorithm, private_key=None, public_key=None):
+    """
+    Loads the keys of an asymmetric algorithm such as RS256, ES256 or EdDSA
+    once, so that PEM keys are not parsed again for every token.
+
+    Returns a tuple of the signing key and the verifying key. The signing key
+    is None if no private key is given. If no public key is given, it is
+    derived from the private key
+
+    :param: algorithm:   The name of the jwt algorithm
+    :param: private_key: A PEM encoded private key or a cryptography key
+    :param: public_key:  A PEM encoded public key or a cryptography key
+    """
+    handlers = jwt.algorithms.get_default_algorithms()
+    ConfigurationError.require_condition(
+        algorithm in handlers,
+        "The {} algorithm is not available. Asymmetric algorithms require "
+        "the cryptography package".format(algorithm),
+    )
+    ConfigurationError.require_condition(
+        private_key is not None or public_key is not None,
+        "JWT_PRIVATE_KEY or JWT_PUBLIC_KEY must be set to use {}".format(algorithm),
+    )
+    handler = handlers[algorithm]
+    with ConfigurationError.handle_errors(
+        "Could not load the keys for {}".format(algorithm)
+    ):
+        signing_key = None
+        if private_key is not None:
+            signing_key = handler.prepare_key(private_key)
+        if public_key is not None:
+            verifying_key = handler.prepare_key(public_key)
+        else:
+            verifying_key = signing_key.public_key()
+    return (signing_key, verifying_key)
+
+
+class JWTCodec:
+    """
+    Signs payloads into jwts and verifies and decodes them again. Payloads are
+    serialized with a JSON codec that is used for both encoding and decoding.
+
+    If a compression threshold is set, payloads whose JSON is at least that
+    many bytes long are compressed with deflate before they are signed. The
+    token header then carries ``"zip": "DEF"`` so that the payload is
+    decompressed when the token is decoded. Smaller payloads are signed as
+    they are, since compressing them does not pay off
+    """
+
+    def __init__(self, json_codec=None, compression_threshold=None):
+        """
+        :param: json_codec:            The JSON codec used to serialize
+                                       payloads. Defaults to the standard
+                                       library's json module
+        :param: compression_threshold: The size in bytes of the JSON payload
+                                       at which it is compressed. If None,
+                                       payloads are never compressed and only
+                                       plain jwts are accepted
+        """
+        self.json_codec = json_codec or JSONCodec()
+        self.compression_threshold = compression_threshold
+
+    def encode(self, payload, key, algorithm):
+        """
+        Signs a payload into a jwt
+        """
+        data = self.json_codec.dumps(payload)
+        headers = None
+        if (
+            self.compression_threshold is not None
+            and len(data) >= self.compression_threshold
+        ):
+            data = deflate(data)
+            headers = {COMPRESSION_HEADER: DEFLATE}
+        return api_jws.encode(data, key, algorithm, headers)
+
+    def decode(self, token, key, algorithms, precheck=None):
+        """
+        Verifies the signature of a jwt and returns its payload. The claims
+        are not validated here because the guard validates them itself.
+
+        If a precheck is given, it is called with the unverified payload
+        before the signature is verified so that it may reject the token
+        cheaply. It must never trust the payload. Compressed payloads are
+        only decompressed after their signature is verified, so they are not
+        prechecked
+        """
+        payload = None
+        if precheck is not None:
+            payload = self._peek(token)
+            if payload is not None:
+                precheck(payload)
+        decoded = api_jws.decode_complete(token, key=key, algorithms=algorithms)
+        if payload is not None:
+            return payload
+        return self._load(
+            decoded["payload"],
+            decoded["header"].get(COMPRESSION_HEADER) == DEFLATE,
+        )
+
+    def _peek(self, token):
+        """
+        Parses the payload of a jwt without verifying its signature. Returns
+        None if the payload is compressed
+        """
+        if isinstance(token, str):
+            token = token.encode("utf-8")
+        try:
+            (header_segment, payload_segment, _) = token.split(b".")
+            header = json.loads(base64url_decode(header_segment))
+            data = base64url_decode(payload_segment)
+        except (TypeError, ValueError):
+            raise jwt.DecodeError("Invalid token structure")
+        if not isinstance(header, dict):
+            raise jwt.DecodeError("Invalid header string: must be a json object")
+        compressed = header.get(COMPRESSION_HEADER) == DEFLATE
+        if compressed and self.compression_threshold is not None:
+            return None
+        return self._load(data, compressed)
+
+    def _load(self, data, compressed):
+        """
+        Deserializes a payload, decompressing it first if it is compressed
+        and compression is enabled
+        """
+        if compressed and self.compression_threshold is not None:
+            try:
+                data = inflate(data)
+            except zlib.error as err:
+                raise jwt.DecodeError("Invalid compressed payload: {}".format(err))
+        try:
+            payload = self.json_codec.loads(data)
+        except ValueError as err:
+            raise jwt.DecodeError("Invalid payload string: {}".format(err))
+        if not isinstance(payload, dict):
+            raise jwt.DecodeError("Invalid payload string: must be a json object")
+        return payload
+
+
+HMAC_DIGESTS = {
+    "HS256": hashlib.sha256,
+    "HS384": hashlib.sha384,
+    "HS512": hashlib.sha512,
+}
+
+
+class HMACJWTCodec(JWTCodec):
+    """
+    Signs and verifies HS256, HS384 and HS512 jwts without going through
+    pyjwt for every token.
+
+    The HMAC state of the key is prepared once and copied for each token, and
+    the header segments for each algorithm are serialized ahead of time. A
+    token is verified directly only if its header is one of these segments.
+    Other keys, algorithms and headers are handled by pyjwt as usual
+    """
+
+    def __init__(self, key, json_codec=None, compression_threshold=None):
+        """
+        :param: key: The secret key that tokens are usually signed with
+        See ``JWTCodec`` for the other parameters
+        """
+        super().__init__(
+            json_codec=json_codec,
+            compression_threshold=compression_threshold,
+        )
+        self.key = key
+        key_bytes = key.encode("utf-8") if isinstance(key, str) else key
+        self._signers = {}
+        self._headers = {}
+        for (algorithm, digest) in HMAC_DIGESTS.items():
+            self._signers[algorithm] = hmac.new(key_bytes, digestmod=digest)
+            header = {"alg": algorithm, "typ": "JWT"}
+            plain = base64url_encode(JSONCodec().dumps(header))
+            header[COMPRESSION_HEADER] = DEFLATE
+            compressed = base64url_encode(JSONCodec().dumps(header))
+            self._headers[algorithm] = (plain, compressed)
+            self._headers[plain] = (algorithm, False)
+            self._headers[compressed] = (algorithm, True)
+
+    def _sign(self, algorithm, signing_input):
+        signer = self._signers[algorithm].copy()
+        signer.update(signing_input)
+        return signer.digest()
+
+    def encode(self, payload, key, algorithm):
+        if algorithm not in self._signers or key != self.key:
+            return super().encode(payload, key, algorithm)
+        data = self.json_codec.dumps(payload)
+        (header, compressed_header) = self._headers[algorithm]
+        if (
+            self.compression_threshold is not None
+            and len(data) >= self.compression_threshold
+        ):
+            data = deflate(data)
+            header = compressed_header
+        signing_input = header + b"." + base64url_encode(data)
+        signature = base64url_encode(self._sign(algorithm, signing_input))
+        return (signing_input + b"." + signature).decode("ascii")
+
+    def decode(self, token, key, algorithms, precheck=None):
+        if key != self.key:
+            return super().decode(token, key, algorithms, precheck)
+        if isinstance(token, str):
+            token = token.encode("utf-8")
+        (header, _, rest) = token.partition(b".")
+        known = self._headers.get(header)
+        if known is None:
+            return super().decode(token, key, algorithms, precheck)
+        (algorithm, compressed) = known
+        if algorithm not in algorithms:
+            raise jwt.InvalidAlgorithmError("The specified alg value is not allowed")
+        (payload_segment, _, signature_segment) = rest.rpartition(b".")
+        try:
+            signature = base64url_decode(signature_segment)
+            data = base64url_decode(payload_segment)
+        except (TypeError, binascii.Error):
+            raise jwt.DecodeError("Invalid token padding")
+        payload = None
+        if precheck is not None and not compressed:
+            payload = self._load(data, compressed)
+            precheck(payload)
+        signing_input = token[: len(header) + 1 + len(payload_segment)]
+        if not payload_segment or not hmac.compare_digest(
+            self._sign(algorithm, signing_input),
+            signature,
+        ):
+            raise jwt.InvalidSignatureError("Signature verification failed")
+        if payload is not None:
+            return payload
+        return self._load(data, compressed)
@@ -1,4 +1,4 @@
-import pendulum
+import datetime
 import enum
 from os.path import dirname, abspath
 
@@ -7,13 +7,29 @@ DEFAULT_JWT_PLACES = ["header", "cookie"]
 DEFAULT_JWT_COOKIE_NAME = "access_token"
 DEFAULT_JWT_HEADER_NAME = "Authorization"
 DEFAULT_JWT_HEADER_TYPE = "Bearer"
-DEFAULT_JWT_ACCESS_LIFESPAN = pendulum.duration(minutes=15)
-DEFAULT_JWT_REFRESH_LIFESPAN = pendulum.duration(days=30)
+DEFAULT_JWT_ACCESS_LIFESPAN = datetime.timedelta(minutes=15)
+DEFAULT_JWT_REFRESH_LIFESPAN = datetime.timedelta(days=30)
 DEFAULT_JWT_ALGORITHM = "HS256"
 DEFAULT_JWT_ALLOWED_ALGORITHMS = ["HS256"]
+DEFAULT_JWT_COMPRESSION_THRESHOLD = None
+DEFAULT_JWT_MAX_TOKEN_LENGTH = 8192
+DEFAULT_JSON_CODEC = "auto"
 
 DEFAULT_ROLES_DISABLED = False
 
+DEFAULT_TOKEN_MODE = "jwt"
+TOKEN_MODES = ("jwt", "opaque")
+DEFAULT_OPAQUE_TOKEN_BYTES = 32
+DEFAULT_CLAIM_STORE_SIZE = 10000
+
+DEFAULT_ROTATE_REFRESH_TOKENS = False
+DEFAULT_REFRESH_REUSE_GRACE = 0
+DEFAULT_REFRESH_FAMILY_STORE_SIZE = 100000
+DEFAULT_REJECTED_TOKEN_CACHE_SIZE = 0
+DEFAULT_REJECTED_TOKEN_TTL = 60
+
+DEFAULT_GUARD_NAME = "praetorian"
+
 DEFAULT_USER_CLASS_VALIDATION_METHOD = "is_valid"
 
 DEFAULT_CONFIRMATION_TEMPLATE = (
@@ -35,6 +51,9 @@ DEFAULT_RESET_SUBJECT = "Password Reset Requested"
 
 DEFAULT_HASH_AUTOUPDATE = False
 DEFAULT_HASH_AUTOTEST = False
+DEFAULT_HASH_LAZY = False
+DEFAULT_HASH_DISABLED = False
+DEFAULT_HASH_DIRECT = False
 DEFAULT_HASH_SCHEME = "pbkdf2_sha512"
 DEFAULT_HASH_ALLOWED_SCHEMES = [
     "pbkdf2_sha512",
@@ -45,10 +64,14 @@ DEFAULT_HASH_ALLOWED_SCHEMES = [
     "bcrypt_sha256",
 ]
 DEFAULT_HASH_DEPRECATED_SCHEMES = []
+DEFAULT_HASH_MEMORY_BUDGET = None
+DEFAULT_HASH_MEMORY_TIMEOUT = None
 
 REFRESH_EXPIRATION_CLAIM = "rf_exp"
 IS_REGISTRATION_TOKEN_CLAIM = "is_ert"
 IS_RESET_TOKEN_CLAIM = "is_prt"
+GUARD_NAME_CLAIM = "grd"
+REFRESH_FAMILY_CLAIM = "fam"
 RESERVED_CLAIMS = {
     "iat",
     "exp",
@@ -58,10 +81,12 @@ RESERVED_CLAIMS = {
     REFRESH_EXPIRATION_CLAIM,
     IS_REGISTRATION_TOKEN_CLAIM,
     IS_RESET_TOKEN_CLAIM,
+    GUARD_NAME_CLAIM,
+    REFRESH_FAMILY_CLAIM,
 }
 
 # 1M days seems reasonable. If this code is being used in 3000 years...welp
-VITAM_AETERNUM = pendulum.Duration(days=1000000)
+VITAM_AETERNUM = datetime.timedelta(days=1000000)
 
 
 class AccessType(enum.Enum):
@@ -3,7 +3,6 @@ import functools
 from flask_praetorian.exceptions import (
     PraetorianError,
     MissingRoleError,
-    MissingToken,
 )
 
 
@@ -16,37 +15,49 @@ from flask_praetorian.utilities import (
 )
 
 
-def _verify_and_add_jwt(optional=False):
+def _verify_and_add_jwt(optional=False, guard=None):
     """
     This helper method just checks and adds jwt data to the app context.
-    If optional is False and the header is missing the token, just returns.
+    If optional is True and the request has no token, just returns without
+    raising or catching an exception, leaving no jwt data in the app context.
+    If a guard is supplied, it is used instead of looking up the current one.
 
-    Will not add jwt data if it is already present.
+    Will not add jwt data if it is already present, unless it was verified by
+    a different guard than the one supplied. In that case, the token is
+    verified again by the supplied guard, so a token from one guard can never
+    satisfy a decorator bound to another.
 
     Only use in this module
     """
-    if not app_context_has_jwt_data():
+    if app_context_has_jwt_data():
+        if guard is None or current_guard() is guard:
+            return
+    elif guard is None:
         guard = current_guard()
-        try:
-            token = guard.read_token()
-        except MissingToken as err:
-            if optional:
-                return
-            raise err
-        jwt_data = guard.extract_jwt_token(token)
-        add_jwt_data_to_app_context(jwt_data)
+    if optional:
+        token = guard.probe_token()
+        if token is None:
+            remove_jwt_data_from_app_context()
+            return
+    else:
+        token = guard.read_token()
+    jwt_data = guard.extract_jwt_token(token)
+    add_jwt_data_to_app_context(jwt_data, guard=guard)
 
 
-def auth_required(method):
+def auth_required(method, guard=None):
     """
     This decorator is used to ensure that a user is authenticated before
     being able to access a flask route. It also adds the current user to the
     current flask context.
+
+    If a guard is supplied, the decorator is bound to that guard. Otherwise,
+    the current guard is looked up for each request
     """
 
     @functools.wraps(method)
     def wrapper(*args, **kwargs):
-        _verify_and_add_jwt()
+        _verify_and_add_jwt(guard=guard)
         try:
             return method(*args, **kwargs)
         finally:
@@ -55,16 +66,19 @@ def auth_required(method):
     return wrapper
 
 
-def auth_accepted(method):
+def auth_accepted(method, guard=None):
     """
     This decorator is used to allow an authenticated user to be identified
     while being able to access a flask route, and adds the current user to the
     current flask context.
+
+    If a guard is supplied, the decorator is bound to that guard. Otherwise,
+    the current guard is looked up for each request
     """
 
     @functools.wraps(method)
     def wrapper(*args, **kwargs):
-        _verify_and_add_jwt(optional=True)
+        _verify_and_add_jwt(optional=True, guard=guard)
         try:
             return method(*args, **kwargs)
         finally:
@@ -73,22 +87,25 @@ def auth_accepted(method):
     return wrapper
 
 
-def roles_required(*required_rolenames):
+def roles_required(*required_rolenames, guard=None):
     """
     This decorator ensures that any uses accessing the decorated route have all
     the needed roles to access it. If an @auth_required decorator is not
     supplied already, this decorator will implicitly check @auth_required first
+
+    If a guard is supplied, the decorator is bound to that guard. Otherwise,
+    the current guard is looked up for each request
     """
+    role_set = set([str(n) for n in required_rolenames])
 
     def decorator(method):
         @functools.wraps(method)
         def wrapper(*args, **kwargs):
             PraetorianError.require_condition(
-                not current_guard().roles_disabled,
+                not (guard or current_guard()).roles_disabled,
                 "This feature is not available because roles are disabled",
             )
-            role_set = set([str(n) for n in required_rolenames])
-            _verify_and_add_jwt()
+            _verify_and_add_jwt(guard=guard)
             try:
                 MissingRoleError.require_condition(
                     current_rolenames().issuperset(role_set),
@@ -105,22 +122,25 @@ def roles_required(*required_rolenames):
     return decorator
 
 
-def roles_accepted(*accepted_rolenames):
+def roles_accepted(*accepted_rolenames, guard=None):
     """
     This decorator ensures that any uses accessing the decorated route have one
     of the needed roles to access it. If an @auth_required decorator is not
     supplied already, this decorator will implicitly check @auth_required first
+
+    If a guard is supplied, the decorator is bound to that guard. Otherwise,
+    the current guard is looked up for each request
     """
+    role_set = set([str(n) for n in accepted_rolenames])
 
     def decorator(method):
         @functools.wraps(method)
         def wrapper(*args, **kwargs):
             PraetorianError.require_condition(
-                not current_guard().roles_disabled,
+                not (guard or current_guard()).roles_disabled,
                 "This feature is not available because roles are disabled",
             )
-            role_set = set([str(n) for n in accepted_rolenames])
-            _verify_and_add_jwt()
+            _verify_and_add_jwt(guard=guard)
             try:
                 MissingRoleError.require_condition(
                     not current_rolenames().isdisjoint(role_set),
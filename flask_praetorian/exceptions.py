@@ -146,6 +146,38 @@ class MisusedResetToken(PraetorianError):
     pass
 
 
+class MisusedGuardToken(PraetorianError):
+    """
+    Attempted to use a token issued by a different guard
+    """
+
+    pass
+
+
+class RefreshTokenReused(PraetorianError):
+    """
+    Attempted to refresh a token that had already been refreshed
+    """
+
+    pass
+
+
+class HashMemoryExhausted(PraetorianError):
+    """
+    The memory budget for concurrent password hashing was exhausted
+    """
+
+    status_code = 503
+
+
+class EmailQueueFull(PraetorianError):
+    """
+    The queue of emails waiting to be sent is full
+    """
+
+    status_code = 503
+
+
 class ConfigurationError(PraetorianError):
     """
     There was a problem with the configuration
@@ -0,0 +1,446 @@
+import base64
+import collections
+import concurrent.futures
+import contextlib
+import hashlib
+import hmac
+import itertools
+import logging
+import os
+import re
+import threading
+
+import flask
+
+from flask_praetorian.exceptions import HashMemoryExhausted
+from flask_praetorian.workers import QueueWorker
+
+
+logger = logging.getLogger("flask_praetorian")
+
+ARGON2_PATTERN = re.compile(r"\$argon2(?:i|d|id)\$(?:v=\d+\$)?m=(\d+)")
+SCRYPT_PATTERN = re.compile(r"\$scrypt\$ln=(\d+),r=(\d+)")
+
+
+def hash_memory_cost(hashed_password):
+    """
+    Estimates the bytes of memory that verifying a hash allocates from the
+    parameters encoded in it. Only memory-hard schemes (argon2 and scrypt)
+    have a cost. Other schemes cost nothing
+    """
+    if isinstance(hashed_password, bytes):
+        hashed_password = hashed_password.decode("ascii", "replace")
+    if not hashed_password:
+        return 0
+    match = ARGON2_PATTERN.match(hashed_password)
+    if match:
+        return int(match.group(1)) * 1024
+    match = SCRYPT_PATTERN.match(hashed_password)
+    if match:
+        return 128 * int(match.group(2)) * 2 ** int(match.group(1))
+    return 0
+
+
+def scheme_memory_cost(pwd_ctx):
+    """
+    Estimates the bytes of memory that hashing a password with the default
+    scheme of a passlib context allocates
+    """
+    handler = pwd_ctx.handler()
+    if handler.name == "argon2":
+        return handler.memory_cost * 1024
+    if handler.name == "scrypt":
+        return 128 * handler.block_size * 2**handler.default_rounds
+    return 0
+
+
+class MemoryBudget:
+    """
+    Limits the memory used by concurrent password hashing.
+
+    Each hash reserves its memory cost before it runs. If the reservation
+    would exceed the budget, the hash waits until enough memory is released.
+    A hash that costs more than the whole budget runs alone
+    """
+
+    def __init__(self, limit, timeout=None):
+        """
+        :param: limit:   The most bytes that concurrent hashes may use
+        :param: timeout: The most seconds to wait for memory. If None, waits
+                         indefinitely. If 0, rejects immediately. A hash that
+                         cannot reserve memory in time raises a
+                         HashMemoryExhausted error
+        """
+        self.limit = limit
+        self.timeout = timeout
+        self.in_use = 0
+        self._condition = threading.Condition()
+
+    @contextlib.contextmanager
+    def reserve(self, cost):
+        """
+        Reserves memory for the duration of the context
+        """
+        cost = min(cost, self.limit)
+        if cost <= 0:
+            yield
+            return
+        with self._condition:
+            reserved = self._condition.wait_for(
+                lambda: self.in_use + cost <= self.limit,
+                timeout=self.timeout,
+            )
+            if not reserved:
+                raise HashMemoryExhausted(
+                    "Too many passwords are being hashed. Try again later"
+                )
+            self.in_use += cost
+        try:
+            yield
+        finally:
+            with self._condition:
+                self.in_use -= cost
+                self._condition.notify_all()
+
+
+def b64_encode(data):
+    """
+    Encodes bytes with unpadded base64 as used in passlib hash strings
+    """
+    return base64.b64encode(data).decode("ascii").rstrip("=")
+
+
+def b64_decode(text):
+    """
+    Decodes unpadded base64. Raises a ValueError if the text is not valid
+    """
+    return base64.b64decode(text + "=" * (-len(text) % 4), validate=True)
+
+
+def ab64_encode(data):
+    """
+    Encodes bytes with passlib's adapted base64, which uses ``.`` for ``+``
+    """
+    return b64_encode(data).replace("+", ".")
+
+
+def ab64_decode(text):
+    """
+    Decodes passlib's adapted base64. Raises a ValueError if the text is not
+    valid
+    """
+    return b64_decode(text.replace(".", "+"))
+
+
+def _to_bytes(password):
+    if isinstance(password, str):
+        return password.encode("utf-8")
+    if isinstance(password, bytes):
+        return password
+    raise TypeError("secret must be unicode or bytes")
+
+
+class PBKDF2Scheme:
+    """
+    Hashes and verifies passlib's ``pbkdf2_sha256`` and ``pbkdf2_sha512``
+    formats with ``hashlib.pbkdf2_hmac``
+    """
+
+    salt_size = 16
+    memory_cost = 0
+
+    def __init__(self, name, digest, rounds, checksum_size):
+        self.name = name
+        self.ident = "$pbkdf2-{}$".format(digest)
+        self.digest = digest
+        self.rounds = rounds
+        self.checksum_size = checksum_size
+
+    def hash(self, password):
+        salt = os.urandom(self.salt_size)
+        checksum = hashlib.pbkdf2_hmac(
+            self.digest,
+            _to_bytes(password),
+            salt,
+            self.rounds,
+            self.checksum_size,
+        )
+        return "{}{}${}${}".format(
+            self.ident,
+            self.rounds,
+            ab64_encode(salt),
+            ab64_encode(checksum),
+        )
+
+    def verify(self, password, hashed_password):
+        try:
+            (rounds, salt, checksum) = hashed_password[len(self.ident) :].split("$")
+            rounds = int(rounds)
+            salt = ab64_decode(salt)
+            checksum = ab64_decode(checksum)
+        except ValueError:
+            raise ValueError("not a valid {} hash".format(self.name))
+        if rounds < 1 or len(checksum) != self.checksum_size:
+            raise ValueError("not a valid {} hash".format(self.name))
+        expected = hashlib.pbkdf2_hmac(
+            self.digest,
+            _to_bytes(password),
+            salt,
+            rounds,
+            self.checksum_size,
+        )
+        return hmac.compare_digest(expected, checksum)
+
+
+class ScryptScheme:
+    """
+    Hashes and verifies passlib's ``scrypt`` format with ``hashlib.scrypt``
+    """
+
+    name = "scrypt"
+    ident = "$scrypt$"
+    salt_size = 16
+    checksum_size = 32
+    rounds = 16
+    block_size = 8
+    parallelism = 1
+    memory_cost = 128 * block_size * 2**rounds
+
+    def _derive(self, password, salt, rounds, block_size, parallelism):
+        n = 2**rounds
+        return hashlib.scrypt(
+            _to_bytes(password),
+            salt=salt,
+            n=n,
+            r=block_size,
+            p=parallelism,
+            maxmem=129 * block_size * (n + parallelism + 2),
+            dklen=self.checksum_size,
+        )
+
+    def hash(self, password):
+        salt = os.urandom(self.salt_size)
+        checksum = self._derive(
+            password,
+            salt,
+            self.rounds,
+            self.block_size,
+            self.parallelism,
+        )
+        return "{}ln={},r={},p={}${}${}".format(
+            self.ident,
+            self.rounds,
+            self.block_size,
+            self.parallelism,
+            b64_encode(salt),
+            b64_encode(checksum),
+        )
+
+    def verify(self, password, hashed_password):
+        try:
+            (params, salt, checksum) = hashed_password[len(self.ident) :].split("$")
+            params = dict(param.split("=") for param in params.split(","))
+            rounds = int(params["ln"])
+            block_size = int(params["r"])
+            parallelism = int(params["p"])
+            salt = b64_decode(salt)
+            checksum = b64_decode(checksum)
+        except (ValueError, KeyError):
+            raise ValueError("not a valid scrypt hash")
+        if len(checksum) != self.checksum_size:
+            raise ValueError("not a valid scrypt hash")
+        expected = self._derive(password, salt, rounds, block_size, parallelism)
+        return hmac.compare_digest(expected, checksum)
+
+
+DIRECT_SCHEMES = {
+    scheme.name: scheme
+    for scheme in (
+        PBKDF2Scheme("pbkdf2_sha256", "sha256", 29000, 32),
+        PBKDF2Scheme("pbkdf2_sha512", "sha512", 25000, 64),
+        ScryptScheme(),
+    )
+}
+
+
+class DirectHasher:
+    """
+    Hashes and verifies the most common schemes with hashlib instead of
+    passlib. Hashes are read and written in passlib's format, so either may
+    verify hashes made by the other.
+
+    The scheme of a hash is found from its prefix with a single lookup.
+    Only schemes that are allowed are recognized. Hashes of any other scheme
+    are left to the passlib password context
+    """
+
+    def __init__(self, schemes, default):
+        """
+        :param: schemes: The names of the allowed schemes
+        :param: default: The name of the scheme used for new hashes
+        """
+        self._schemes = {
+            DIRECT_SCHEMES[name].ident: DIRECT_SCHEMES[name]
+            for name in schemes
+            if name in DIRECT_SCHEMES
+        }
+        self.default = DIRECT_SCHEMES.get(default)
+
+    def identify(self, hashed_password):
+        """
+        Finds the scheme of a hash. Returns None if the scheme is not handled
+        directly
+        """
+        if not isinstance(hashed_password, str) or hashed_password[:1] != "$":
+            return None
+        end = hashed_password.find("$", 1)
+        return self._schemes.get(hashed_password[: end + 1])
+
+
+_worker_hash = None
+
+
+def _start_hash_worker(pwd_ctx_settings, direct):
+    """
+    Builds the hasher used by a worker process of ``hash_passwords()``
+    """
+    global _worker_hash
+    scheme = DIRECT_SCHEMES.get(pwd_ctx_settings["default"]) if direct else None
+    if scheme is not None:
+        _worker_hash = scheme.hash
+    else:
+        from passlib.context import CryptContext
+
+        _worker_hash = CryptContext(**pwd_ctx_settings).hash
+
+
+def _hash_chunk(raw_passwords):
+    return [_worker_hash(raw_password) for raw_password in raw_passwords]
+
+
+def hash_passwords(
+    raw_passwords,
+    pwd_ctx_settings,
+    direct=False,
+    max_workers=None,
+    chunk_size=16,
+):
+    """
+    Hashes passwords in a pool of processes and yields the hashes in the same
+    order as the passwords.
+
+    Passwords are consumed lazily in chunks. At most two chunks per worker
+    are in flight at once, so memory use does not grow with the number of
+    passwords
+
+    :param: raw_passwords:    An iterable of plaintext passwords
+    :param: pwd_ctx_settings: The settings of the passlib password context
+    :param: direct:           If set, the default scheme is hashed with
+                              hashlib when it is handled directly
+    :param: max_workers:      The number of processes. Defaults to the number
+                              of cpus
+    :param: chunk_size:       The number of passwords sent to a process at once
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    passwords = iter(raw_passwords)
+    pending = collections.deque()
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers,
+        initializer=_start_hash_worker,
+        initargs=(pwd_ctx_settings, direct),
+    ) as executor:
+        try:
+            while True:
+                while len(pending) < 2 * max_workers:
+                    chunk = list(itertools.islice(passwords, chunk_size))
+                    if not chunk:
+                        break
+                    pending.append(executor.submit(_hash_chunk, chunk))
+                if not pending:
+                    return
+                yield from pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+class PasswordUpdater:
+    """
+    Provides the interface for persisting password hashes that were upgraded
+    while a user authenticated.
+
+    By default, an upgraded hash is assigned to ``user.password`` and the app
+    must save the user. If a guard is given a password updater with the
+    ``password_updater`` argument of ``init_app``, the upgraded hash is handed
+    to the updater instead and the user is not modified
+    """
+
+    def update(self, user, hashed_password):
+        """
+        Accepts an upgraded hash for a user. Should return quickly
+
+        :param: user:            The user whose password was rehashed
+        :param: hashed_password: The upgraded password hash
+        """
+        raise NotImplementedError
+
+
+class ThreadedPasswordUpdater(PasswordUpdater):
+    """
+    Saves upgraded password hashes in batches from a background thread so
+    that logins do not wait on a write.
+
+    Subclass this and implement ``save_batch()``. If the queue is full, the
+    upgrade is dropped with a logged warning. The user keeps the old hash,
+    which is upgraded again at their next login
+    """
+
+    def __init__(self, max_queue_size=1000, batch_size=100):
+        """
+        :param: max_queue_size: The most upgraded hashes that may wait to be
+                                saved
+        :param: batch_size:     The most upgraded hashes saved at once
+        """
+        self.worker = QueueWorker(
+            self._save_batch,
+            max_queue_size=max_queue_size,
+            batch_size=batch_size,
+            name="praetorian-password-updater",
+        )
+
+    def update(self, user, hashed_password):
+        """
+        Queues an upgraded hash to be saved by the background thread
+        """
+        app = flask.current_app._get_current_object()
+        if not self.worker.put((app, user.identity, hashed_password)):
+            logger.warning(
+                "Dropped an upgraded password hash because the queue is full"
+            )
+
+    def join(self):
+        """
+        Blocks until every queued hash has been saved
+        """
+        self.worker.join()
+
+    def _save_batch(self, batch):
+        """
+        Saves a batch of queued hashes within the context of their app. If a
+        user's hash was upgraded more than once, only the latest is saved
+        """
+        apps = {}
+        for (app, identity, hashed_password) in batch:
+            apps.setdefault(app, {})[identity] = hashed_password
+        for (app, updates) in apps.items():
+            with app.app_context():
+                self.save_batch(list(updates.items()))
+
+    def save_batch(self, updates):
+        """
+        Saves upgraded hashes. Called on the background thread within an app
+        context
+
+        :param: updates: A list of (identity, hashed_password) pairs
+        """
+        raise NotImplementedError
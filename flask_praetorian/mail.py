@@ -0,0 +1,223 @@
+import email.message
+import logging
+import os
+import threading
+import time
+import uuid
+
+import flask
+
+from flask_praetorian.exceptions import ConfigurationError, EmailQueueFull
+from flask_praetorian.workers import QueueWorker
+
+
+logger = logging.getLogger("flask_praetorian")
+
+
+class EmailDispatcher:
+    """
+    Provides the interface for handing off rendered token bearing emails
+    instead of sending them while the request waits.
+
+    Subclass this and implement ``dispatch()`` to send emails through an
+    external task queue. Supply an instance to Praetorian's ``init_app`` with
+    the ``email_dispatcher`` argument
+    """
+
+    def dispatch(self, notification, message):
+        """
+        Accepts a rendered email for delivery. Should return quickly.
+
+        :param: notification: The dict that describes the email. It includes
+                              the ``email``, ``subject`` and rendered
+                              ``message`` (html) and is returned to the
+                              caller of ``send_token_email()``
+        :param: message:      The flask-mailman EmailMessage that is ready to
+                              be sent
+        """
+        raise NotImplementedError
+
+
+class ThreadedEmailDispatcher(EmailDispatcher):
+    """
+    Sends emails from an in-process queue on a background thread. Emails that
+    are queued together are sent over a single mail connection. A message that
+    fails to send is retried before it is dropped with a logged error
+    """
+
+    def __init__(self, max_queue_size=1000, retries=3, retry_delay=1.0):
+        """
+        :param: max_queue_size: The most emails that may wait to be sent. If
+                                the queue is full, dispatching raises an
+                                EmailQueueFull error
+        :param: retries:        How many more times a failed message is tried
+        :param: retry_delay:    Seconds to wait before the first retry. The
+                                delay doubles for each further retry
+        """
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.worker = QueueWorker(
+            self._send_batch,
+            max_queue_size=max_queue_size,
+            name="praetorian-email",
+        )
+
+    def dispatch(self, notification, message):
+        """
+        Queues the email to be sent by the background thread
+        """
+        app = flask.current_app._get_current_object()
+        EmailQueueFull.require_condition(
+            self.worker.put((app, notification, message)),
+            "The email queue is full. Try again later",
+        )
+
+    def join(self):
+        """
+        Blocks until every queued email has been handled
+        """
+        self.worker.join()
+
+    def _send_batch(self, batch):
+        """
+        Sends a batch of queued emails, grouped by app so that each group
+        shares a mail connection
+        """
+        apps = {}
+        for (app, notification, message) in batch:
+            apps.setdefault(app, []).append((notification, message))
+        for (app, emails) in apps.items():
+            with app.app_context():
+                shared = None
+                try:
+                    for (notification, message) in emails:
+                        connection = message.connection
+                        if connection is None:
+                            if shared is None:
+                                shared = app.extensions["mailman"].get_connection()
+                            connection = shared
+                        self._send(connection, notification, message)
+                finally:
+                    if shared is not None:
+                        shared.close()
+
+    def _send(self, connection, notification, message):
+        """
+        Sends one message, retrying with a growing delay if it fails. The
+        connection is opened before each attempt, which reopens it after a
+        failed attempt closed it and does nothing if it is already open
+        """
+        delay = self.retry_delay
+        for attempt in range(self.retries + 1):
+            try:
+                connection.open()
+                notification["result"] = connection.send_messages([message]) == 1
+                return
+            except Exception as err:
+                notification["error"] = "{}: {}".format(type(err).__name__, err)
+                if attempt == self.retries:
+                    break
+                connection.close()
+                time.sleep(delay)
+                delay *= 2
+        notification["result"] = False
+        logger.error(
+            "Giving up on email to %s: %s",
+            notification["email"],
+            notification["error"],
+        )
+
+
+class CaptureMailBackend:
+    """
+    Provides the interface of a flask-mailman backend for backends that
+    capture emails instead of sending them. These do not need a mail
+    extension, which makes them useful for testing and load testing the email
+    flows. Select one with the ``PRAETORIAN_MAIL_BACKEND`` setting
+    """
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def send_messages(self, messages):
+        """
+        Captures the messages. Returns the number of messages captured
+        """
+        count = 0
+        for message in messages:
+            self.capture(message)
+            count += 1
+        return count
+
+    def capture(self, message):
+        raise NotImplementedError
+
+
+class MemoryMailBackend(CaptureMailBackend):
+    """
+    Captures emails in the ``outbox`` list
+    """
+
+    def __init__(self):
+        self.outbox = []
+
+    def capture(self, message):
+        self.outbox.append(message)
+
+
+class SpoolMailBackend(CaptureMailBackend):
+    """
+    Captures emails by writing each one to a ``.eml`` file in a directory
+    """
+
+    def __init__(self, directory):
+        ConfigurationError.require_condition(
+            directory,
+            "PRAETORIAN_MAIL_SPOOL_DIR must be set to use the spool mail backend",
+        )
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._count = 0
+
+    def capture(self, message):
+        spooled = email.message.EmailMessage()
+        spooled["Subject"] = message.subject
+        spooled["From"] = message.from_email
+        spooled["To"] = ", ".join(message.to)
+        spooled.set_content(message.body, subtype=message.content_subtype)
+        with self._lock:
+            self._count += 1
+            count = self._count
+        path = os.path.join(
+            self.directory,
+            "{:08d}-{}.eml".format(count, uuid.uuid4().hex),
+        )
+        with open(path, "wb") as fh:
+            fh.write(spooled.as_bytes())
+
+
+def get_mail_backend(name, spool_dir=None):
+    """
+    Builds the capture mail backend selected by name
+
+    :param: name:      Either ``"memory"`` or ``"spool"``
+    :param: spool_dir: The directory where the spool backend writes emails
+    """
+    if name == "memory":
+        return MemoryMailBackend()
+    if name == "spool":
+        return SpoolMailBackend(spool_dir)
+    raise ConfigurationError(
+        "PRAETORIAN_MAIL_BACKEND must be 'memory' or 'spool', not {!r}".format(name)
+    )
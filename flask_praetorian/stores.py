@@ -0,0 +1,329 @@
+import collections
+import heapq
+import threading
+import time
+
+
+class ClaimStore:
+    """
+    Provides the interface for storing the claims of opaque tokens.
+
+    When ``PRAETORIAN_TOKEN_MODE`` is ``"opaque"``, the guard issues short
+    random tokens and keeps their claims in a claim store instead of signing
+    them into a JWT. Subclass this to keep claims in a database table or a
+    key-value service. Lookups should be a single indexed read by key
+    """
+
+    def put(self, key, claims, expires_at):
+        """
+        Stores the claims for a token
+
+        :param: key:        The opaque token
+        :param: claims:     The dict of claims for the token
+        :param: expires_at: The unix timestamp after which the token can no
+                            longer be used or refreshed. Stores may discard
+                            the claims after this moment
+        """
+        raise NotImplementedError
+
+    def get(self, key):
+        """
+        Fetches the claims for a token. Returns None if the token is unknown.
+        The returned claims should not be modified
+        """
+        raise NotImplementedError
+
+    def delete(self, key):
+        """
+        Discards the claims for a token. Unknown tokens are ignored
+        """
+        raise NotImplementedError
+
+
+class MemoryClaimStore(ClaimStore):
+    """
+    Keeps claims in process memory. Claims are discarded once their token
+    expires. Once ``max_size`` unexpired tokens are stored, the least recently
+    used tokens are discarded to make room for new ones.
+
+    The ``clock`` provides the current unix timestamp. The guard supplies its
+    own clock when it creates the store.
+
+    Tokens are only recognized by the process that issued them, so this store
+    suits single process services and tests
+    """
+
+    def __init__(self, max_size=10000, clock=time.time):
+        self.max_size = max_size
+        self.clock = clock
+        self._claims = collections.OrderedDict()
+        self._expirations = []
+        self._lock = threading.Lock()
+
+    def _discard(self, moment):
+        """
+        Discards the claims of expired tokens, then the least recently used
+        claims while the store is over its size limit
+        """
+        claims = self._claims
+        expirations = self._expirations
+        while expirations and moment > expirations[0][0]:
+            (expires_at, key) = heapq.heappop(expirations)
+            entry = claims.get(key)
+            if entry is not None and entry[1] == expires_at:
+                del claims[key]
+        while len(claims) > self.max_size:
+            claims.popitem(last=False)
+        if len(expirations) > 2 * len(claims) + 1000:
+            self._expirations = [
+                (expires_at, key) for (key, (_, expires_at)) in claims.items()
+            ]
+            heapq.heapify(self._expirations)
+
+    def put(self, key, claims, expires_at):
+        with self._lock:
+            self._claims[key] = (claims, expires_at)
+            self._claims.move_to_end(key)
+            heapq.heappush(self._expirations, (expires_at, key))
+            self._discard(self.clock())
+
+    def get(self, key):
+        with self._lock:
+            entry = self._claims.get(key)
+            if entry is None:
+                return None
+            if self.clock() > entry[1]:
+                del self._claims[key]
+                return None
+            self._claims.move_to_end(key)
+            return entry[0]
+
+    def delete(self, key):
+        with self._lock:
+            self._claims.pop(key, None)
+
+    def __len__(self):
+        return len(self._claims)
+
+
+class RefreshFamilyStore:
+    """
+    Provides the interface for tracking rotating refresh token families.
+
+    When ``PRAETORIAN_ROTATE_REFRESH_TOKENS`` is set, each token starts a
+    family and every refresh issues a new jti within it. The store remembers
+    the current jti of each family. Refreshing any other token of the family
+    means that a token was stolen, so the whole family is revoked.
+
+    Stores must keep revoked and rotated families until they expire. A
+    family that the store does not know is only adopted when the guard asks
+    for it, which it does for tokens issued before rotation was enabled.
+
+    Subclass this to keep families in a database or key-value service.
+    ``rotate()`` must be atomic, and every method should take constant time
+    """
+
+    def start(self, family, jti, moment, expires_at):
+        """
+        Starts tracking a new family whose current token has the given jti
+
+        :param: family:     The family id
+        :param: jti:        The jti of the family's first token
+        :param: moment:     The current unix timestamp
+        :param: expires_at: The unix timestamp after which no token of the
+                            family can be refreshed. Stores may discard the
+                            family after this moment
+        """
+        raise NotImplementedError
+
+    def rotate(self, family, jti, new_jti, moment, grace, expires_at, adopt=False):
+        """
+        Rotates a family to a new jti if the refreshed token is its current
+        token. Otherwise, the family is revoked.
+
+        A token that was rotated out no more than ``grace`` seconds ago is
+        tolerated so that concurrent refreshes by one client do not revoke
+        the family. The family is not rotated again in this case.
+
+        Returns the jti for the refreshed token, or None if the family was
+        revoked or is unknown
+
+        :param: family:     The family id
+        :param: jti:        The jti of the token being refreshed
+        :param: new_jti:    The jti to rotate to
+        :param: moment:     The current unix timestamp
+        :param: grace:      Seconds during which a rotated out token is still
+                            tolerated
+        :param: expires_at: See ``start()``
+        :param: adopt:      If set, a family that the store does not know
+                            starts being tracked instead of being rejected
+        """
+        raise NotImplementedError
+
+    def is_revoked(self, family):
+        """
+        Checks if a family has been revoked
+        """
+        raise NotImplementedError
+
+    def revoke(self, family, expires_at=None):
+        """
+        Revokes a family so that none of its tokens may be used
+
+        :param: expires_at: The unix timestamp until which the revocation
+                            must be kept. Defaults to the family's expiration
+        """
+        raise NotImplementedError
+
+
+_REVOKED = object()
+
+
+class MemoryRefreshFamilyStore(RefreshFamilyStore):
+    """
+    Tracks refresh families in process memory. Each family is kept as a small
+    tuple of its current jti, its previous jti, the moment it was rotated and
+    the moment it expires.
+
+    Families are discarded once they expire. When more than ``max_size``
+    families are tracked, the least recently started families that were never
+    rotated are discarded. Their tokens can then no longer be refreshed.
+    Revoked and rotated families are kept until they expire even if that
+    takes the store over ``max_size``, so that a stolen token is never
+    accepted again.
+
+    Families are only known to the process that tracks them, so tokens
+    issued before a restart can not be refreshed after it
+    """
+
+    def __init__(self, max_size=100000):
+        self.max_size = max_size
+        self._families = {}
+        self._unrotated = collections.OrderedDict()
+        self._expirations = []
+        self._lock = threading.Lock()
+
+    def _set(self, family, record):
+        previous = self._families.get(family)
+        self._families[family] = record
+        if previous is None or previous[3] != record[3]:
+            heapq.heappush(self._expirations, (record[3], family))
+
+    def _discard(self, moment):
+        expirations = self._expirations
+        while expirations and expirations[0][0] < moment:
+            (expires_at, family) = heapq.heappop(expirations)
+            record = self._families.get(family)
+            if record is not None and record[3] == expires_at:
+                del self._families[family]
+                self._unrotated.pop(family, None)
+        while len(self._families) > self.max_size and self._unrotated:
+            (family, _) = self._unrotated.popitem(last=False)
+            del self._families[family]
+        if len(expirations) > 2 * len(self._families) + 1000:
+            self._expirations = [
+                (record[3], family) for (family, record) in self._families.items()
+            ]
+            heapq.heapify(self._expirations)
+
+    def start(self, family, jti, moment, expires_at):
+        with self._lock:
+            self._set(family, (jti, None, None, expires_at))
+            self._unrotated[family] = None
+            self._discard(moment)
+
+    def rotate(self, family, jti, new_jti, moment, grace, expires_at, adopt=False):
+        with self._lock:
+            self._discard(moment)
+            record = self._families.get(family)
+            if record is None:
+                if not adopt:
+                    return None
+                record = (jti, None, None, expires_at)
+            (current, previous, rotated_at, family_expires_at) = record
+            if current is _REVOKED:
+                return None
+            expires_at = max(expires_at, family_expires_at)
+            if current == jti:
+                self._set(family, (new_jti, jti, moment, expires_at))
+                self._unrotated.pop(family, None)
+                return new_jti
+            if jti == previous and moment - rotated_at <= grace:
+                return current
+            self._set(family, (_REVOKED, None, None, expires_at))
+            self._unrotated.pop(family, None)
+            return None
+
+    def is_revoked(self, family):
+        record = self._families.get(family)
+        return record is not None and record[0] is _REVOKED
+
+    def revoke(self, family, expires_at=None):
+        with self._lock:
+            record = self._families.get(family)
+            if expires_at is None:
+                expires_at = record[3] if record is not None else float("inf")
+            self._set(family, (_REVOKED, None, None, expires_at))
+            self._unrotated.pop(family, None)
+
+    def __len__(self):
+        return len(self._families)
+
+
+class RejectedTokenCache:
+    """
+    Remembers recently rejected tokens so that clients that retry the same
+    expired or forged token are rejected again without decoding it.
+
+    Keys should be a digest of the token together with the access type it was
+    rejected for. Each entry keeps the exception class and message to raise
+    again until it expires. Once ``max_size`` entries are cached, the least
+    recently used entries are discarded.
+
+    The ``hits`` and ``misses`` counters show how much retry traffic the
+    cache absorbs
+    """
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._rejections = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, moment):
+        """
+        Fetches the cached rejection for a key as a tuple of the exception
+        class and message. Returns None if the key is unknown or its entry
+        has expired at the given unix timestamp
+        """
+        with self._lock:
+            rejection = self._rejections.get(key)
+            if rejection is not None and moment > rejection[2]:
+                del self._rejections[key]
+                rejection = None
+            if rejection is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._rejections.move_to_end(key)
+            return rejection[:2]
+
+    def put(self, key, exc_class, message, expires_at):
+        """
+        Caches a rejection until the given unix timestamp
+        """
+        with self._lock:
+            self._rejections[key] = (exc_class, message, expires_at)
+            self._rejections.move_to_end(key)
+            while len(self._rejections) > self.max_size:
+                self._rejections.popitem(last=False)
+
+    def stats(self):
+        """
+        Reports the hits, misses and current size of the cache
+        """
+        return dict(hits=self.hits, misses=self.misses, size=len(self._rejections))
+
+    def __len__(self):
+        return len(self._rejections)
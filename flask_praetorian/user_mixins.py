@@ -1,3 +1,6 @@
+from flask_praetorian.hashing import ThreadedPasswordUpdater
+
+
 class SQLAlchemyUserMixin:
     """
     A short-cut providing required methods and attributes for a user class
@@ -51,3 +54,40 @@ class SQLAlchemyUserMixin:
         Provides the required classmethod ``identify()``
         """
         return cls.query.get(id)
+
+
+class SQLAlchemyPasswordUpdater(ThreadedPasswordUpdater):
+    """
+    Saves upgraded password hashes for a sqlalchemy user class from a
+    background thread. Each batch is saved in a single transaction.
+
+    Makes the same assumptions as ``SQLAlchemyUserMixin``. In particular, the
+    user identity must be the ``id`` column
+    """
+
+    def __init__(self, db, user_class, column="hashed_password", **kwargs):
+        """
+        :param: db:         The flask-sqlalchemy instance
+        :param: user_class: The sqlalchemy user model
+        :param: column:     The name of the column that holds the hash
+        :param: kwargs:     Passed on to ``ThreadedPasswordUpdater``
+        """
+        super().__init__(**kwargs)
+        self.db = db
+        self.user_class = user_class
+        self.column = column
+
+    def save_batch(self, updates):
+        import sqlalchemy
+
+        try:
+            for (identity, hashed_password) in updates:
+                self.db.session.execute(
+                    sqlalchemy.update(self.user_class)
+                    .where(self.user_class.id == identity)
+                    .values({self.column: hashed_password})
+                )
+            self.db.session.commit()
+        except Exception:
+            self.db.session.rollback()
+            raise
@@ -1,13 +1,14 @@
+import datetime
 import functools
 import inspect
 import json
 import re
+import time
 import warnings
 
 import flask
-import pendulum
 
-from flask_praetorian.constants import RESERVED_CLAIMS
+from flask_praetorian.constants import DEFAULT_GUARD_NAME, RESERVED_CLAIMS
 from flask_praetorian.exceptions import PraetorianError, ConfigurationError
 
 
@@ -46,15 +47,62 @@ def duration_from_string(text):
         "Couldn't parse {}".format(text),
     )
     with ConfigurationError.handle_errors("Couldn't parse {}".format(text)):
-        return pendulum.duration(**clean)
+        return duration_from_dict(clean)
 
 
-def current_guard():
+def duration_from_dict(parts):
+    """
+    Builds a duration from a dict of keyword arguments like
+    ``{"days": 1, "hours": 2}``. A plain timedelta is returned unless calendar
+    units (years or months) are used. In that case, pendulum is imported on
+    demand to build the duration
+    """
+    if "years" in parts or "months" in parts:
+        import pendulum
+
+        return pendulum.duration(**parts)
+    return datetime.timedelta(**parts)
+
+
+def duration_to_seconds(duration):
+    """
+    Converts a lifespan to a whole number of seconds. The lifespan may be
+    supplied as an integer number of seconds, a timedelta (including pendulum
+    durations), a dict that can be parsed by ``duration_from_dict`` or a
+    string that can be parsed by ``duration_from_string``.
+
+    Note that months and years are counted as 30 and 365 days respectively
+    """
+    if isinstance(duration, int):
+        return duration
+    if isinstance(duration, dict):
+        duration = duration_from_dict(duration)
+    elif isinstance(duration, str):
+        duration = duration_from_string(duration)
+    return int(duration.total_seconds())
+
+
+def current_timestamp():
+    """
+    Provides the current time as an integer unix timestamp. This is the
+    default clock that Praetorian uses for issuing and validating tokens
+    """
+    return int(time.time())
+
+
+def current_guard(name=None):
     """
     Fetches the current instance of flask-praetorian that is attached to the
-    current flask app
+    current flask app. If a guard has already verified a token for the current
+    request, that guard is returned. If a name is supplied, the guard that was
+    registered under that name is fetched instead
     """
-    guard = flask.current_app.extensions.get("praetorian", None)
+    if name is None:
+        guard = flask.g.get("_flask_praetorian_guard")
+        if guard is None:
+            guard = flask.current_app.extensions.get(DEFAULT_GUARD_NAME, None)
+    else:
+        guard = flask.current_app.extensions.get("praetorian_guards", {}).get(name)
     PraetorianError.require_condition(
         guard is not None,
         "No current guard found; Praetorian must be initialized first",
@@ -66,16 +114,20 @@ def app_context_has_jwt_data():
     """
     Checks if there is already jwt_data added to the app context
     """
-    return hasattr(flask.g, "_flask_praetorian_jwt_data")
+    return "_flask_praetorian_jwt_data" in flask.g
 
 
-def add_jwt_data_to_app_context(jwt_data):
+def add_jwt_data_to_app_context(jwt_data, guard=None):
     """
     Adds a dictionary of jwt data (presumably unpacked from a token) to the
-    top of the flask app's context
+    top of the flask app's context. If the guard that unpacked the data is
+    supplied, it is stored alongside so that the current user can be
+    identified with the matching user class
     """
     ctx = flask.g
     ctx._flask_praetorian_jwt_data = jwt_data
+    if guard is not None:
+        ctx._flask_praetorian_guard = guard
 
 
 def get_jwt_data_from_app_context():
@@ -83,7 +135,7 @@ def get_jwt_data_from_app_context():
     Fetches a dict of jwt token data from the top of the flask app's context
     """
     ctx = flask.g
-    jwt_data = getattr(ctx, "_flask_praetorian_jwt_data", None)
+    jwt_data = ctx.get("_flask_praetorian_jwt_data")
     PraetorianError.require_condition(
         jwt_data is not None,
         """
@@ -99,8 +151,8 @@ def remove_jwt_data_from_app_context():
     Removes the dict of jwt token data from the top of the flask app's context
     """
     ctx = flask.g
-    if app_context_has_jwt_data():
-        del ctx._flask_praetorian_jwt_data
+    ctx.pop("_flask_praetorian_jwt_data", None)
+    ctx.pop("_flask_praetorian_guard", None)
 
 
 def current_user_id():
@@ -163,6 +215,32 @@ def is_jsonable(instance):
         return False
 
 
+@functools.singledispatch
+def identity_claim(identity):
+    """
+    Converts a user identity to a value that can be carried in a token. The
+    conversion is chosen by the identity's type, so the common identity types
+    are returned without trying to serialize them. Identities that are not
+    JSON types, such as UUIDs, are converted to strings
+    """
+    return str(identity)
+
+
+@identity_claim.register(str)
+@identity_claim.register(int)
+@identity_claim.register(float)
+@identity_claim.register(type(None))
+def _identity_claim_scalar(identity):
+    return identity
+
+
+@identity_claim.register(list)
+@identity_claim.register(tuple)
+@identity_claim.register(dict)
+def _identity_claim_container(identity):
+    return identity if is_jsonable(identity) else str(identity)
+
+
 def deprecated(reason):
     """
     This is a decorator which can be used to mark functions
@@ -0,0 +1,84 @@
+import logging
+import queue
+import threading
+
+
+logger = logging.getLogger("flask_praetorian")
+
+
+class QueueWorker:
+    """
+    Processes items from a bounded queue on a background daemon thread.
+
+    The worker waits for an item and then takes any others that are already
+    queued (up to ``batch_size``) so that they can be handled together. The
+    thread is started when the first item is queued
+    """
+
+    def __init__(self, handle_batch, max_queue_size=1000, batch_size=100, name=None):
+        """
+        :param: handle_batch:   A function that is called on the worker thread
+                                with a list of queued items
+        :param: max_queue_size: The most items that may be waiting at once
+        :param: batch_size:     The most items passed to handle_batch at once
+        :param: name:           A name for the worker thread
+        """
+        self.handle_batch = handle_batch
+        self.batch_size = batch_size
+        self.name = name
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def put(self, item):
+        """
+        Queues an item without blocking. Returns False if the queue is full
+        """
+        self._start()
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            return False
+        return True
+
+    def join(self):
+        """
+        Blocks until every queued item has been handled
+        """
+        self._queue.join()
+
+    def _start(self):
+        """
+        Starts the worker thread if it is not already running
+        """
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name=self.name,
+                    daemon=True,
+                )
+                self._thread.start()
+
+    def _run(self):
+        """
+        Handles batches of items for as long as the process runs
+        """
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.handle_batch(batch)
+            except Exception:
+                logger.exception(
+                    "Background worker failed to handle a batch"
+                )
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
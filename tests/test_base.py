@@ -1,7 +1,11 @@
 import jwt
+import logging
+import os
 import pendulum
 import plummet
 import pytest
+import subprocess
+import sys
 from dataclasses import dataclass
 from uuid import UUID, uuid4
 
@@ -10,9 +14,12 @@ from flask_praetorian.exceptions import (
     AuthenticationError,
     BlacklistedError,
     ClaimCollisionError,
+    ConfigurationError,
     EarlyRefreshError,
     ExpiredAccessError,
     ExpiredRefreshError,
+    HashMemoryExhausted,
+    InvalidTokenHeader,
     InvalidUserError,
     MissingClaimError,
     MissingUserError,
@@ -20,6 +27,7 @@ from flask_praetorian.exceptions import (
     MisusedResetToken,
     PraetorianError,
     LegacyScheme,
+    RefreshTokenReused,
 )
 from flask_praetorian.constants import (
     AccessType,
@@ -35,6 +43,28 @@ from flask_praetorian.constants import (
 
 
 class TestPraetorian:
+    def test_import_does_not_load_optional_dependencies(self):
+        """
+        This test verifies that importing flask_praetorian does not import
+        the modules that are only needed for hashing, email or calendar
+        based durations
+        """
+        script = "; ".join(
+            [
+                "import sys",
+                "import flask_praetorian",
+                "print(sorted(m for m in ['pendulum', 'passlib', 'flask_mailman']"
+                " if m in sys.modules))",
+            ]
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", script],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        assert result.stdout.strip() == "[]"
+
     def test_hash_password(self, app, user_class, default_guard):
         """
         This test verifies that Praetorian hashes passwords using the scheme
@@ -45,6 +75,60 @@ class TestPraetorian:
         secret = default_guard.hash_password("some password")
         assert default_guard.pwd_ctx.identify(secret) == "pbkdf2_sha512"
 
+    def test_hash_passwords(self, app, user_class, default_guard):
+        """
+        This test verifies that many passwords can be hashed in a pool of
+        processes and that the hashes are yielded in order
+        """
+        passwords = ["abides", "nihilist", "bowling", "rug", "white russian"]
+        hashed_passwords = list(
+            default_guard.hash_passwords(iter(passwords), max_workers=2, chunk_size=2)
+        )
+        assert len(hashed_passwords) == len(passwords)
+        for (password, hashed_password) in zip(passwords, hashed_passwords):
+            assert default_guard._verify_password(password, hashed_password)
+
+        hashed_passwords = list(default_guard.hash_passwords(passwords, max_workers=1))
+        for (password, hashed_password) in zip(passwords, hashed_passwords):
+            assert default_guard._verify_password(password, hashed_password)
+
+        assert list(default_guard.hash_passwords([], max_workers=2)) == []
+
+    def test_hash_password__lazy_context(self, app, user_class):
+        """
+        This test verifies that when PRAETORIAN_HASH_LAZY is set, the password
+        context is not built until hashing is first needed
+        """
+        app.config["PRAETORIAN_HASH_LAZY"] = True
+        guard = Praetorian(app, user_class)
+        assert guard._pwd_ctx is None
+
+        secret = guard.hash_password("some password")
+        assert guard._pwd_ctx is not None
+        assert guard._verify_password("some password", secret)
+
+    def test_hash_password__disabled(self, app, user_class, db):
+        """
+        This test verifies that when PRAETORIAN_HASH_DISABLED is set, no
+        password context is built and hashing methods raise an error, but
+        tokens may still be issued and verified
+        """
+        app.config["PRAETORIAN_HASH_DISABLED"] = True
+        guard = Praetorian(app, user_class)
+        assert guard.pwd_ctx is None
+
+        with pytest.raises(ConfigurationError, match="hashing is disabled"):
+            guard.hash_password("some password")
+
+        the_dude = user_class(username="TheDude", password="not a hash")
+        db.session.add(the_dude)
+        db.session.commit()
+        with pytest.raises(ConfigurationError, match="hashing is disabled"):
+            guard.authenticate("TheDude", "some password")
+
+        token = guard.encode_jwt_token(the_dude)
+        assert guard.extract_jwt_token(token)["id"] == the_dude.id
+
     def test__verify_password(self, app, user_class, default_guard):
         """
         This test verifies that the _verify_password function can be used to
@@ -599,6 +683,508 @@ class TestPraetorian:
         expected_message = "custom claims collide"
         assert expected_message in str(err_info.value)
 
+    def test_encode_jwt_token__uses_injected_clock(self, app, user_class):
+        """
+        This test verifies that a guard supplied with a clock uses it to issue
+        and validate tokens instead of the system time
+        """
+        now = [1495391995]
+        guard = Praetorian(app, user_class, clock=lambda: now[0])
+        the_dude = user_class(
+            id=13,
+            username="TheDude",
+            password=guard.hash_password("abides"),
+        )
+        token = guard.encode_jwt_token(
+            the_dude,
+            override_access_lifespan=dict(minutes=1),
+            override_refresh_lifespan=pendulum.Duration(hours=1),
+        )
+        token_data = guard.extract_jwt_token(token)
+        assert token_data["iat"] == now[0]
+        assert token_data["exp"] == now[0] + 60
+        assert token_data[REFRESH_EXPIRATION_CLAIM] == now[0] + 3600
+
+        now[0] += 61
+        with pytest.raises(ExpiredAccessError):
+            guard.extract_jwt_token(token)
+
+    def test_encode_jwt_token__logs_claim_keys(self, app, user_class, caplog):
+        """
+        This test verifies that encoding a token logs the names of the custom
+        claims, but not their values, to the flask_praetorian logger
+        """
+        guard = Praetorian(app, user_class)
+        the_dude = user_class(id=13, username="TheDude")
+
+        with caplog.at_level(logging.INFO, logger="flask_praetorian"):
+            guard.encode_jwt_token(the_dude, rug="tied the room together")
+        assert caplog.records == []
+
+        with caplog.at_level(logging.DEBUG, logger="flask_praetorian"):
+            guard.encode_jwt_token(the_dude, rug="tied the room together")
+            guard.encode_jwt_tokens([the_dude], rug="tied the room together")
+        assert [r.name for r in caplog.records] == ["flask_praetorian"] * 2
+        assert [r.claim_keys for r in caplog.records] == [["rug"], ["rug"]]
+        assert "rug" in caplog.text
+        assert "tied the room together" not in caplog.text
+
+    def test_encode_jwt_tokens(self, app, user_class, validating_user_class):
+        """
+        This test verifies that encode_jwt_tokens issues a token for each user
+        in order, at a shared moment and with the shared claims, whether the
+        tokens are signed serially or by a pool of workers
+        """
+        now = [1495391995]
+        guard = Praetorian(app, user_class, clock=lambda: now[0])
+        users = [
+            user_class(id=i, username="user{}".format(i), roles="service")
+            for i in range(20)
+        ]
+        with pytest.raises(ClaimCollisionError):
+            guard.encode_jwt_tokens(users, exp=0)
+
+        for max_workers in (None, 4):
+            tokens = guard.encode_jwt_tokens(
+                users,
+                override_access_lifespan=dict(hours=1),
+                max_workers=max_workers,
+                tenant="abides",
+            )
+            assert len(tokens) == len(users)
+            datas = [guard.extract_jwt_token(t) for t in tokens]
+            assert [d["id"] for d in datas] == list(range(20))
+            assert len(set(d["jti"] for d in datas)) == 20
+            for data in datas:
+                assert data["iat"] == now[0]
+                assert data["exp"] == now[0] + 3600
+                assert data["rls"] == "service"
+                assert data["tenant"] == "abides"
+
+        assert guard.encode_jwt_tokens([]) == []
+
+        validating_guard = Praetorian(app, validating_user_class)
+        brandt = validating_user_class(username="brandt", is_active=False)
+        with pytest.raises(InvalidUserError):
+            validating_guard.encode_jwt_tokens([brandt])
+        tokens = validating_guard.encode_jwt_tokens([brandt], bypass_user_check=True)
+        assert len(tokens) == 1
+
+    def test_encode_jwt_token__opaque_mode(self, app, user_class, db):
+        """
+        This test verifies that a guard in opaque token mode issues short
+        random tokens whose claims are resolved from the claim store, that
+        refreshing replaces the old token, and that jwts are still accepted
+        """
+        jwt_guard = Praetorian(app, user_class)
+        app.config["PRAETORIAN_TOKEN_MODE"] = "opaque"
+        now = [1495391995]
+        guard = Praetorian(app, user_class, clock=lambda: now[0])
+        the_dude = user_class(
+            id=13,
+            username="TheDude",
+            password=guard.hash_password("abides"),
+            roles="admin",
+        )
+        db.session.add(the_dude)
+        db.session.commit()
+        token = guard.encode_jwt_token(
+            the_dude,
+            override_access_lifespan=dict(minutes=1),
+            duder="brief",
+        )
+        assert "." not in token
+        assert len(token) < 50
+        token_data = guard.extract_jwt_token(token)
+        assert token_data["id"] == 13
+        assert token_data["rls"] == "admin"
+        assert token_data["duder"] == "brief"
+        assert guard.claim_store.get(token) is token_data
+
+        with pytest.raises(InvalidTokenHeader):
+            guard.extract_jwt_token("not-a-known-token")
+
+        now[0] += 61
+        with pytest.raises(ExpiredAccessError):
+            guard.extract_jwt_token(token)
+
+        with plummet.frozen_time(pendulum.from_timestamp(now[0])):
+            jwt_token = jwt_guard.encode_jwt_token(the_dude)
+        assert guard.extract_jwt_token(jwt_token)["id"] == 13
+
+        new_token = guard.refresh_jwt_token(token)
+        assert guard.claim_store.get(token) is None
+        new_token_data = guard.extract_jwt_token(new_token)
+        assert new_token_data["jti"] == token_data["jti"]
+        assert new_token_data["duder"] == "brief"
+
+    def test_encode_jwt_token__compresses_large_payloads(self, app, user_class, db):
+        """
+        This test verifies that tokens with large custom claims are compressed
+        when a compression threshold is set and that they can be extracted and
+        refreshed
+        """
+        app.config["JWT_COMPRESSION_THRESHOLD"] = 512
+        now = [1495391995]
+        guard = Praetorian(app, user_class, clock=lambda: now[0])
+        the_dude = user_class(
+            id=13,
+            username="TheDude",
+            password=guard.hash_password("abides"),
+        )
+        db.session.add(the_dude)
+        db.session.commit()
+
+        tenants = {"tenant{}".format(i): ["read", "write"] for i in range(50)}
+        token = guard.encode_jwt_token(the_dude, tenants=tenants)
+        assert jwt.get_unverified_header(token)["zip"] == "DEF"
+        assert guard.extract_jwt_token(token)["tenants"] == tenants
+
+        small_token = guard.encode_jwt_token(the_dude)
+        assert "zip" not in jwt.get_unverified_header(small_token)
+        assert guard.extract_jwt_token(small_token)["id"] == 13
+
+        now[0] += int(DEFAULT_JWT_ACCESS_LIFESPAN.total_seconds()) + 1
+        new_token = guard.refresh_jwt_token(token)
+        assert jwt.get_unverified_header(new_token)["zip"] == "DEF"
+        assert guard.extract_jwt_token(new_token)["tenants"] == tenants
+
+    def test_refresh_jwt_token__rotates_families(self, app, user_class, db):
+        """
+        This test verifies that with rotating refresh tokens each refresh
+        issues a new jti in the same family, that refreshing a rotated out
+        token revokes the family, and that a rotated out token is tolerated
+        within the reuse grace period
+        """
+        app.config["PRAETORIAN_ROTATE_REFRESH_TOKENS"] = True
+        app.config["PRAETORIAN_REFRESH_REUSE_GRACE"] = 5
+        now = [1495391995]
+        guard = Praetorian(app, user_class, clock=lambda: now[0])
+        the_dude = user_class(
+            id=13,
+            username="TheDude",
+            password=guard.hash_password("abides"),
+        )
+        db.session.add(the_dude)
+        db.session.commit()
+        lifespan = int(DEFAULT_JWT_ACCESS_LIFESPAN.total_seconds())
+
+        token = guard.encode_jwt_token(the_dude)
+        data = guard.extract_jwt_token(token)
+        assert data["fam"] == data["jti"]
+
+        now[0] += lifespan + 1
+        new_token = guard.refresh_jwt_token(token)
+        new_data = guard.extract_jwt_token(new_token)
+        assert new_data["fam"] == data["fam"]
+        assert new_data["jti"] != data["jti"]
+
+        now[0] += 5
+        grace_token = guard.refresh_jwt_token(token)
+        assert guard.extract_jwt_token(grace_token)["jti"] == new_data["jti"]
+
+        now[0] += lifespan + 1
+        newer_token = guard.refresh_jwt_token(new_token)
+        assert guard.extract_jwt_token(newer_token)["fam"] == data["fam"]
+
+        now[0] += 6
+        with pytest.raises(RefreshTokenReused):
+            guard.refresh_jwt_token(new_token)
+        with pytest.raises(BlacklistedError):
+            guard.extract_jwt_token(newer_token)
+        with pytest.raises(BlacklistedError):
+            guard.refresh_jwt_token(newer_token)
+
+        other_token = guard.encode_jwt_token(the_dude)
+        assert guard.extract_jwt_token(other_token)["id"] == 13
+
+    def test_refresh_jwt_token__retry_after_failure(self, app, user_class, db):
+        """
+        This test verifies that when refreshing fails before the new token is
+        issued, the family is not rotated, so retrying with the same token
+        succeeds instead of revoking the family
+        """
+        app.config["PRAETORIAN_ROTATE_REFRESH_TOKENS"] = True
+        now = [1495391995]
+        failures = [RuntimeError("Nihilists!")]
+        hooked = []
+
+        def flaky_hook(**payload_parts):
+            if failures:
+                raise failures.pop()
+            hooked.append(payload_parts["jti"])
+
+        guard = Praetorian(
+            app,
+            user_class,
+            refresh_jwt_token_hook=flaky_hook,
+            clock=lambda: now[0],
+        )
+        the_dude = user_class(
+            id=13,
+            username="TheDude",
+            password=guard.hash_password("abides"),
+        )
+        db.session.add(the_dude)
+        db.session.commit()
+
+        token = guard.encode_jwt_token(the_dude)
+        family = guard.extract_jwt_token(token)["fam"]
+        now[0] += guard._access_lifespan_seconds + 1
+        with pytest.raises(RuntimeError):
+            guard.refresh_jwt_token(token)
+
+        now[0] += 5
+        new_data = guard.extract_jwt_token(guard.refresh_jwt_token(token))
+        assert new_data["jti"] == hooked[0]
+        assert new_data["fam"] == family
+
+    def test_refresh_jwt_token__reuse_after_eviction(self, app, user_class, db):
+        """
+        This test verifies that a revoked family stays revoked after the
+        family store is filled by new logins, and that tokens from families
+        the store does not know are not refreshed
+        """
+        app.config["PRAETORIAN_ROTATE_REFRESH_TOKENS"] = True
+        app.config["PRAETORIAN_REFRESH_FAMILY_STORE_SIZE"] = 3
+        now = [1495391995]
+        guard = Praetorian(app, user_class, clock=lambda: now[0])
+        the_dude = user_class(id=13, username="TheDude", roles="admin")
+        db.session.add(the_dude)
+        db.session.commit()
+        lifespan = int(DEFAULT_JWT_ACCESS_LIFESPAN.total_seconds())
+
+        stolen_token = guard.encode_jwt_token(the_dude)
+        now[0] += lifespan + 1
+        guard.refresh_jwt_token(stolen_token)
+        now[0] += 1
+        with pytest.raises(RefreshTokenReused):
+            guard.refresh_jwt_token(stolen_token)
+
+        for _ in range(3):
+            guard.encode_jwt_token(the_dude)
+        with pytest.raises(BlacklistedError):
+            guard.refresh_jwt_token(stolen_token)
+
+        token = guard.encode_jwt_token(the_dude)
+        now[0] += lifespan + 1
+        restarted_guard = Praetorian(app, user_class, clock=lambda: now[0])
+        with pytest.raises(RefreshTokenReused):
+            restarted_guard.refresh_jwt_token(token)
+
+        # put away your toys
+        db.session.delete(the_dude)
+        db.session.commit()
+
+    def test_init_app__fails_with_unknown_token_mode(self, app, user_class):
+        """
+        This test verifies that an unknown token mode is a configuration error
+        """
+        app.config["PRAETORIAN_TOKEN_MODE"] = "smoke-signals"
+        with pytest.raises(ConfigurationError):
+            Praetorian(app, user_class)
+
+    def test_extract_jwt_token__rejects_before_verification(
+        self, app, user_class, monkeypatch
+    ):
+        """
+        This test verifies that tokens that are too long or malformed, and
+        expired tokens, are rejected without verifying their signature, and
+        that unexpired tokens with a bad signature are still rejected
+        """
+        app.config["JWT_MAX_TOKEN_LENGTH"] = 512
+        now = [1495391995]
+        guard = Praetorian(app, user_class, clock=lambda: now[0])
+        the_dude = user_class(id=13, username="TheDude", roles="admin")
+        token = guard.encode_jwt_token(the_dude)
+        (header, payload, signature) = token.split(".")
+        forged = ".".join([header, payload, signature[::-1]])
+
+        with pytest.raises(InvalidTokenHeader, match="longer than 512"):
+            guard.extract_jwt_token(token + "A" * 512)
+        with pytest.raises(InvalidTokenHeader, match="longer than 512"):
+            guard._unpack_header(
+                {DEFAULT_JWT_HEADER_NAME: "Bearer " + token + "A" * 512},
+            )
+        with pytest.raises(InvalidTokenHeader, match="three segments"):
+            guard.extract_jwt_token(header + "." + payload)
+        with pytest.raises(InvalidTokenHeader, match="Signature"):
+            guard.extract_jwt_token(forged)
+
+        now[0] += guard._access_lifespan_seconds + 1
+        verified = []
+        sign = guard.jwt_codec._sign
+
+        def recording_sign(*args):
+            verified.append(args)
+            return sign(*args)
+
+        monkeypatch.setattr(guard.jwt_codec, "_sign", recording_sign)
+        with pytest.raises(ExpiredAccessError):
+            guard.extract_jwt_token(forged)
+        assert verified == []
+
+        now[0] += guard._refresh_lifespan_seconds
+        with pytest.raises(ExpiredRefreshError):
+            guard.extract_jwt_token(forged, access_type=AccessType.refresh)
+        assert verified == []
+
+    def test_extract_jwt_token__registered_claims(self, app, user_class):
+        """
+        This test verifies that registered claims that praetorian does not
+        issue itself are still validated when a token carries them: tokens
+        that are not yet valid or that are meant for another audience are
+        rejected
+        """
+        now = [1495391995]
+        guard = Praetorian(app, user_class, clock=lambda: now[0])
+        the_dude = user_class(id=13, username="TheDude", roles="admin")
+
+        token = guard.encode_jwt_token(
+            the_dude,
+            override_access_lifespan=pendulum.Duration(hours=2),
+            nbf=now[0] + 3600,
+        )
+        with pytest.raises(InvalidTokenHeader, match=r"not yet valid \(nbf\)"):
+            guard.extract_jwt_token(token)
+        now[0] += 3600
+        assert guard.extract_jwt_token(token)["nbf"] == now[0]
+
+        token = guard.encode_jwt_token(the_dude, nbf="soon")
+        with pytest.raises(InvalidTokenHeader, match="must be an integer"):
+            guard.extract_jwt_token(token)
+
+        token = guard.encode_jwt_token(the_dude, aud="other-service")
+        with pytest.raises(InvalidTokenHeader, match="Invalid audience"):
+            guard.extract_jwt_token(token)
+
+        token = guard.encode_jwt_token(the_dude)
+        now[0] -= 60
+        with pytest.raises(InvalidTokenHeader, match=r"not yet valid \(iat\)"):
+            guard.extract_jwt_token(token)
+
+    def test_extract_jwt_token__caches_rejections(self, app, user_class, monkeypatch):
+        """
+        This test verifies that with 'PRAETORIAN_REJECTED_TOKEN_CACHE_SIZE',
+        a token that was rejected is rejected again without being decoded
+        until the rejection expires, and that tokens refreshed too early are
+        not cached
+        """
+        app.config["PRAETORIAN_REJECTED_TOKEN_CACHE_SIZE"] = 10
+        app.config["PRAETORIAN_REJECTED_TOKEN_TTL"] = {"seconds": 30}
+        now = [1495391995]
+        guard = Praetorian(app, user_class, clock=lambda: now[0])
+        the_dude = user_class(id=13, username="TheDude", roles="admin")
+        token = guard.encode_jwt_token(the_dude)
+        (header, payload, signature) = token.split(".")
+        forged = ".".join([header, payload, signature[::-1]])
+
+        decoded = []
+        decode = guard.jwt_codec.decode
+
+        def counting_decode(*args, **kwargs):
+            decoded.append(args[0])
+            return decode(*args, **kwargs)
+
+        monkeypatch.setattr(guard.jwt_codec, "decode", counting_decode)
+
+        for _ in range(3):
+            with pytest.raises(InvalidTokenHeader, match="Signature"):
+                guard.extract_jwt_token(forged)
+        assert decoded == [forged]
+        assert guard.rejected_tokens.stats() == dict(hits=2, misses=1, size=1)
+
+        for _ in range(2):
+            with pytest.raises(EarlyRefreshError):
+                guard.extract_jwt_token(token, access_type=AccessType.refresh)
+        assert decoded == [forged, token, token]
+        assert guard.extract_jwt_token(token)["id"] == 13
+
+        now[0] += 31
+        with pytest.raises(InvalidTokenHeader):
+            guard.extract_jwt_token(forged)
+        assert decoded == [forged, token, token, token, forged]
+
+    def test_encode_jwt_token__eddsa(self, app, user_class, db):
+        """
+        This test verifies that tokens can be signed with EdDSA using a
+        private key and verified by a guard that only has the public key
+        """
+        serialization = pytest.importorskip(
+            "cryptography.hazmat.primitives.serialization"
+        )
+        ed25519 = pytest.importorskip(
+            "cryptography.hazmat.primitives.asymmetric.ed25519"
+        )
+        private_key = ed25519.Ed25519PrivateKey.generate()
+        private_pem = private_key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        ).decode("ascii")
+        public_pem = (
+            private_key.public_key()
+            .public_bytes(
+                serialization.Encoding.PEM,
+                serialization.PublicFormat.SubjectPublicKeyInfo,
+            )
+            .decode("ascii")
+        )
+
+        app.config["JWT_ALGORITHM"] = "EdDSA"
+        app.config["JWT_PRIVATE_KEY"] = private_pem
+        guard = Praetorian(app, user_class)
+        assert guard.allowed_algorithms == ["EdDSA"]
+        the_dude = user_class(
+            username="TheDude",
+            password=guard.hash_password("abides"),
+        )
+        db.session.add(the_dude)
+        db.session.commit()
+
+        with plummet.frozen_time("2017-05-21 18:39:55"):
+            token = guard.encode_jwt_token(the_dude)
+            assert jwt.get_unverified_header(token)["alg"] == "EdDSA"
+            assert guard.extract_jwt_token(token)["id"] == the_dude.id
+
+            del app.config["JWT_PRIVATE_KEY"]
+            app.config["JWT_PUBLIC_KEY"] = public_pem
+            verifying_guard = Praetorian(app, user_class)
+            assert verifying_guard.extract_jwt_token(token)["id"] == the_dude.id
+            with pytest.raises(ConfigurationError):
+                verifying_guard.encode_jwt_token(the_dude)
+
+            app.config["JWT_ALGORITHM"] = "HS256"
+            hmac_guard = Praetorian(app, user_class)
+            with pytest.raises(InvalidTokenHeader):
+                hmac_guard.extract_jwt_token(token)
+
+        # put away your toys
+        db.session.delete(the_dude)
+        db.session.commit()
+
+    def test_init_app__fails_with_bad_asymmetric_config(self, app, user_class):
+        """
+        This test verifies that asymmetric algorithms require loadable keys
+        and may not be allowed alongside HMAC algorithms
+        """
+        ed25519 = pytest.importorskip(
+            "cryptography.hazmat.primitives.asymmetric.ed25519"
+        )
+        app.config["JWT_ALGORITHM"] = "EdDSA"
+        with pytest.raises(ConfigurationError):
+            Praetorian(app, user_class)
+
+        app.config["JWT_PRIVATE_KEY"] = "not a pem key"
+        with pytest.raises(ConfigurationError):
+            Praetorian(app, user_class)
+
+        app.config["JWT_PRIVATE_KEY"] = ed25519.Ed25519PrivateKey.generate()
+        Praetorian(app, user_class)
+        app.config["JWT_ALLOWED_ALGORITHMS"] = ["EdDSA", "HS256"]
+        with pytest.raises(ConfigurationError):
+            Praetorian(app, user_class)
+
     def test_encode_eternal_jwt_token(self, app, user_class):
         """
         This test verifies that the encode_eternal_jwt_token correctly encodes
@@ -922,6 +1508,33 @@ class TestPraetorian:
         assert guard.read_token_from_cookie() == token
         assert guard.read_token() == token
 
+    def test_probe_token(self, app, user_class, client, use_cookie):
+        """
+        This test verifies that probing for a token returns None without
+        raising when the request has no token, finds tokens in headers and
+        cookies, and still rejects malformed headers
+        """
+        guard = Praetorian(app, user_class)
+        the_dude = user_class(id=13, username="TheDude", roles="admin")
+        token = guard.encode_jwt_token(the_dude)
+
+        client.get("/unprotected")
+        assert guard.probe_token() is None
+
+        client.get(
+            "/unprotected",
+            headers={DEFAULT_JWT_HEADER_NAME: DEFAULT_JWT_HEADER_TYPE + " " + token},
+        )
+        assert guard.probe_token() == token
+
+        client.get("/unprotected", headers={DEFAULT_JWT_HEADER_NAME: "Basic abc"})
+        with pytest.raises(InvalidTokenHeader):
+            guard.probe_token()
+
+        with use_cookie(token):
+            client.get("/unprotected")
+        assert guard.probe_token() == token
+
     def test_pack_header_for_user(self, app, user_class):
         """
         This test::
@@ -1156,6 +1769,107 @@ class TestPraetorian:
         )
         assert jwt_data[IS_REGISTRATION_TOKEN_CLAIM]
 
+    def test_send_bulk_emails(
+        self,
+        app,
+        user_class,
+        db,
+        tmpdir,
+        default_guard,
+        monkeypatch,
+    ):
+        """
+        This test verifies that registration and reset emails may be sent to
+        many users at once over a single mail connection, that the results
+        are returned in order, and that a failure to send one message is
+        reported without stopping the rest, as is a failure to mint the
+        token for one user
+        """
+        template_file = tmpdir.join("test_template.html")
+        template_file.write("<body>{{ token }}</body>")
+        default_guard.confirmation_template = str(template_file)
+        default_guard.confirmation_sender = "mailer.daemon@stranger.com"
+        default_guard.reset_template = str(template_file)
+        default_guard.reset_sender = "mailer.daemon@stranger.com"
+
+        the_dude = user_class(username="TheDude")
+        walter = user_class(username="Walter")
+        donnie = user_class(username="Donnie")
+        db.session.add_all([the_dude, walter, donnie])
+        db.session.commit()
+        pairs = [
+            ("the.dude@abides.com", the_dude),
+            ("walter@sobchak.com", walter),
+            ("donnie@outofhiselement.com", donnie),
+        ]
+
+        mailman = app.extensions["mailman"]
+        mailman.outbox = []
+        notifications = default_guard.send_registration_emails(pairs)
+        assert [n["email"] for n in notifications] == [p[0] for p in pairs]
+        assert all(n["result"] is True for n in notifications)
+        assert [m.body for m in mailman.outbox] == [
+            n["message"] for n in notifications
+        ]
+        for (notification, (_, user)) in zip(notifications, pairs):
+            assert default_guard.get_user_from_registration_token(
+                notification["token"]
+            ) == user
+
+        from flask_mailman.backends.locmem import EmailBackend
+
+        send_messages = EmailBackend.send_messages
+
+        def flaky_send_messages(backend, messages):
+            if messages[0].to == ["walter@sobchak.com"]:
+                raise RuntimeError("Mark it zero")
+            return send_messages(backend, messages)
+
+        monkeypatch.setattr(EmailBackend, "send_messages", flaky_send_messages)
+        mailman.outbox = []
+        notifications = default_guard.send_reset_emails(pairs)
+        assert [n["result"] for n in notifications] == [True, False, True]
+        assert "Mark it zero" in notifications[1]["error"]
+        assert len(mailman.outbox) == 2
+        assert default_guard.validate_reset_token(notifications[2]["token"]) == donnie
+
+        monkeypatch.setattr(EmailBackend, "send_messages", send_messages)
+        maude = user_class(username="Maude")
+        db.session.add(maude)
+        db.session.commit()
+        walter.is_valid = lambda: False
+        pairs.append(("maude@lebowski.com", maude))
+        mailman.outbox = []
+        notifications = default_guard.send_reset_emails(pairs)
+        assert [n["email"] for n in notifications] == [p[0] for p in pairs]
+        assert [n["result"] for n in notifications] == [True, False, True, True]
+        assert "InvalidUserError" in notifications[1]["error"]
+        assert notifications[1]["token"] is None
+        assert [m.to for m in mailman.outbox] == [
+            [email] for (email, _) in pairs if email != "walter@sobchak.com"
+        ]
+        assert default_guard.validate_reset_token(notifications[3]["token"]) == maude
+
+    def test_get_email_template(self, app, user_class, tmpdir):
+        """
+        This test verifies that email templates are compiled once and only
+        reloaded when the template file is modified
+        """
+        guard = Praetorian(app, user_class)
+        template_file = tmpdir.join("test_template.html")
+        template_file.write("<body>{{ token }}</body>")
+
+        template = guard.get_email_template(str(template_file))
+        assert template.render(token="abides") == "<body>abides</body>"
+        assert guard.get_email_template(str(template_file)) is template
+
+        template_file.write("<p>{{ token }}</p>")
+        stat = os.stat(str(template_file))
+        os.utime(str(template_file), (stat.st_atime, stat.st_mtime + 10))
+        reloaded = guard.get_email_template(str(template_file))
+        assert reloaded is not template
+        assert reloaded.render(token="abides") == "<p>abides</p>"
+
     def test_get_user_from_registration_token(
         self,
         app,
@@ -1321,3 +2035,115 @@ class TestPraetorian:
         # put away your toys
         db.session.delete(the_dude)
         db.session.commit()
+
+    def test_authenticate__direct_hashing(self, app, user_class, db):
+        """
+        This test verifies that with 'PRAETORIAN_HASH_DIRECT', passwords of
+        common schemes are hashed and verified without building the passlib
+        password context, and that other schemes still use it
+        """
+        app.config["PRAETORIAN_HASH_DIRECT"] = True
+        app.config["PRAETORIAN_HASH_LAZY"] = True
+        guard = Praetorian(app, user_class)
+        the_dude = user_class(
+            username="TheDude",
+            password=guard.hash_password("abides"),
+        )
+        db.session.add(the_dude)
+        db.session.commit()
+
+        assert the_dude.password.startswith("$pbkdf2-sha512$")
+        assert guard.authenticate("TheDude", "abides") is the_dude
+        with pytest.raises(AuthenticationError):
+            guard.authenticate("TheDude", "nihilist")
+        assert guard._pwd_ctx is None
+
+        the_dude.password = guard.pwd_ctx.handler("sha256_crypt").hash("abides")
+        assert guard.authenticate("TheDude", "abides") is the_dude
+
+        # put away your toys
+        db.session.delete(the_dude)
+        db.session.commit()
+
+    def test_authenticate__limits_hash_memory(self, app, user_class, db):
+        """
+        This test verifies that hashing and verifying passwords with a
+        memory-hard scheme is rejected when 'PRAETORIAN_HASH_MEMORY_BUDGET'
+        is used up and 'PRAETORIAN_HASH_MEMORY_TIMEOUT' runs out
+        """
+        pytest.importorskip("argon2")
+        app.config["PRAETORIAN_HASH_SCHEME"] = "argon2"
+        app.config["PRAETORIAN_HASH_MEMORY_BUDGET"] = 1024 * 1024 * 1024
+        app.config["PRAETORIAN_HASH_MEMORY_TIMEOUT"] = 0
+        guard = Praetorian(app, user_class)
+        the_dude = user_class(
+            username="TheDude",
+            password=guard.hash_password("abides"),
+        )
+        db.session.add(the_dude)
+        db.session.commit()
+
+        assert guard.authenticate("TheDude", "abides") is the_dude
+        assert guard.hash_memory_budget.in_use == 0
+
+        with guard.hash_memory_budget.reserve(1024 * 1024 * 1024):
+            with pytest.raises(HashMemoryExhausted):
+                guard.authenticate("TheDude", "abides")
+            with pytest.raises(HashMemoryExhausted):
+                guard.hash_password("abides")
+        assert guard.authenticate("TheDude", "abides") is the_dude
+
+        # put away your toys
+        db.session.delete(the_dude)
+        db.session.commit()
+
+    def test_authenticate__upgrades_hash_with_one_verification(
+        self, app, user_class, db, monkeypatch
+    ):
+        """
+        This test verifies that authenticating with a legacy hash and
+        'PRAETORIAN_HASH_AUTOUPDATE' verifies the legacy hash only once
+        """
+        from passlib.handlers.pbkdf2 import pbkdf2_sha256
+
+        app.config["PRAETORIAN_HASH_ALLOWED_SCHEMES"] = [
+            "pbkdf2_sha512",
+            "pbkdf2_sha256",
+        ]
+        app.config["PRAETORIAN_HASH_SCHEME"] = "pbkdf2_sha256"
+        legacy_guard = Praetorian(app, user_class)
+        the_dude = user_class(
+            username="TheDude",
+            password=legacy_guard.hash_password("abides"),
+        )
+        db.session.add(the_dude)
+        db.session.commit()
+
+        app.config["PRAETORIAN_HASH_SCHEME"] = "pbkdf2_sha512"
+        app.config["PRAETORIAN_HASH_DEPRECATED_SCHEMES"] = ["pbkdf2_sha256"]
+        app.config["PRAETORIAN_HASH_AUTOUPDATE"] = True
+        guard = Praetorian(app, user_class)
+
+        calls = []
+        calc_checksum = pbkdf2_sha256._calc_checksum
+
+        def counting_calc_checksum(handler, secret):
+            calls.append(secret)
+            return calc_checksum(handler, secret)
+
+        monkeypatch.setattr(pbkdf2_sha256, "_calc_checksum", counting_calc_checksum)
+
+        with pytest.raises(AuthenticationError):
+            guard.authenticate("TheDude", "nihilist")
+        assert len(calls) == 1
+        assert the_dude.password.startswith("$pbkdf2-sha256$")
+
+        updated_dude = guard.authenticate("TheDude", "abides")
+        assert len(calls) == 2
+        assert updated_dude.password.startswith("$pbkdf2-sha512$")
+        assert guard.authenticate("TheDude", "abides") is updated_dude
+        assert len(calls) == 2
+
+        # put away your toys
+        db.session.delete(the_dude)
+        db.session.commit()
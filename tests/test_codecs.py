@@ -0,0 +1,200 @@
+import jwt
+import pytest
+import sys
+
+from flask_praetorian.codecs import (
+    HMACJWTCodec,
+    JSONCodec,
+    JWTCodec,
+    OrjsonCodec,
+    deflate,
+    get_json_codec,
+)
+from flask_praetorian.exceptions import ConfigurationError
+
+
+class TestJSONCodecs:
+    def test_get_json_codec(self, monkeypatch):
+        """
+        This test verifies that JSON codecs are selected by name, that "auto"
+        falls back to the standard library, and that unknown or missing
+        codecs are configuration errors
+        """
+        assert type(get_json_codec("json")) is JSONCodec
+        with pytest.raises(ConfigurationError):
+            get_json_codec("pickle")
+
+        monkeypatch.setitem(sys.modules, "orjson", None)
+        assert type(get_json_codec("auto")) is JSONCodec
+        with pytest.raises(ConfigurationError):
+            get_json_codec("orjson")
+
+    def test_orjson_codec(self):
+        """
+        This test verifies that tokens encoded with orjson can be decoded with
+        the standard library and the other way around
+        """
+        pytest.importorskip("orjson")
+        assert type(get_json_codec("auto")) is OrjsonCodec
+
+        payload = {"id": 13, "rls": "admin", "tenants": {"a": [1, 2.5, None]}}
+        orjson_codec = JWTCodec(json_codec=OrjsonCodec())
+        json_codec = JWTCodec(json_codec=JSONCodec())
+        token = orjson_codec.encode(payload, "secret", "HS256")
+        assert json_codec.decode(token, "secret", ["HS256"]) == payload
+        token = json_codec.encode(payload, "secret", "HS256")
+        assert orjson_codec.decode(token, "secret", ["HS256"]) == payload
+        with pytest.raises(jwt.DecodeError):
+            orjson_codec.decode(
+                jwt.api_jws.encode(b"{nope", "secret", "HS256"),
+                "secret",
+                ["HS256"],
+            )
+
+
+class TestJWTCodec:
+    def test_encode_and_decode__without_compression(self):
+        """
+        This test verifies that a codec without a compression threshold issues
+        plain jwts that pyjwt can decode
+        """
+        codec = JWTCodec()
+        payload = {"id": 13, "rls": "admin", "perms": ["read"] * 100}
+        token = codec.encode(payload, "secret", "HS256")
+        assert "zip" not in jwt.get_unverified_header(token)
+        assert jwt.decode(token, "secret", algorithms=["HS256"]) == payload
+        assert codec.decode(token, "secret", ["HS256"]) == payload
+
+    def test_encode_and_decode__with_compression(self):
+        """
+        This test verifies that payloads at or above the threshold are
+        compressed and that smaller payloads are not
+        """
+        codec = JWTCodec(compression_threshold=256)
+        small_payload = {"id": 13, "rls": "admin"}
+        large_payload = {"id": 13, "rls": "admin", "perms": ["read"] * 100}
+
+        small_token = codec.encode(small_payload, "secret", "HS256")
+        assert "zip" not in jwt.get_unverified_header(small_token)
+        assert codec.decode(small_token, "secret", ["HS256"]) == small_payload
+
+        large_token = codec.encode(large_payload, "secret", "HS256")
+        assert jwt.get_unverified_header(large_token)["zip"] == "DEF"
+        assert len(large_token) < len(JWTCodec().encode(large_payload, "secret", "HS256"))
+        assert codec.decode(large_token, "secret", ["HS256"]) == large_payload
+
+    def test_decode__fails_on_bad_tokens(self):
+        """
+        This test verifies that tampered tokens and compressed payloads that
+        are not json objects are rejected
+        """
+        codec = JWTCodec(compression_threshold=0)
+        token = codec.encode({"id": 13}, "secret", "HS256")
+        with pytest.raises(jwt.InvalidSignatureError):
+            codec.decode(token, "other secret", ["HS256"])
+
+        token = jwt.api_jws.encode(
+            deflate(b"[1, 2, 3]"),
+            "secret",
+            "HS256",
+            {"zip": "DEF"},
+        )
+        with pytest.raises(jwt.DecodeError):
+            codec.decode(token, "secret", ["HS256"])
+
+        token = jwt.api_jws.encode(b"not deflated", "secret", "HS256", {"zip": "DEF"})
+        with pytest.raises(jwt.DecodeError):
+            codec.decode(token, "secret", ["HS256"])
+
+    @pytest.mark.parametrize("codec_class", [JWTCodec, HMACJWTCodec])
+    def test_decode__prechecks_uncompressed_payloads(self, codec_class):
+        """
+        This test verifies that a precheck sees the payload before the
+        signature is verified, and that compressed payloads are not
+        prechecked because they are only decompressed once verified
+        """
+        codec = (
+            codec_class("secret", compression_threshold=256)
+            if codec_class is HMACJWTCodec
+            else codec_class(compression_threshold=256)
+        )
+        seen = []
+
+        class Rejected(Exception):
+            pass
+
+        def precheck(payload):
+            seen.append(payload)
+            raise Rejected()
+
+        token = codec.encode({"id": 13}, "secret", "HS256")
+        with pytest.raises(Rejected):
+            codec.decode(token, "secret", ["HS256"], precheck=precheck)
+        assert seen == [{"id": 13}]
+        assert codec.decode(token, "secret", ["HS256"], precheck=seen.append) == {
+            "id": 13
+        }
+
+        payload = {"id": 13, "perms": ["read"] * 100}
+        token = codec.encode(payload, "secret", "HS256")
+        assert codec.decode(token, "secret", ["HS256"], precheck=precheck) == payload
+        assert len(seen) == 2
+
+
+class TestHMACJWTCodec:
+    @pytest.mark.parametrize("algorithm", ["HS256", "HS384", "HS512"])
+    def test_encode_and_decode__match_pyjwt(self, algorithm):
+        """
+        This test verifies that tokens are signed exactly as pyjwt signs them
+        and that tokens signed by pyjwt are verified directly
+        """
+        codec = HMACJWTCodec("secret", compression_threshold=256)
+        plain_codec = JWTCodec(compression_threshold=256)
+        small_payload = {"id": 13, "rls": "admin"}
+        large_payload = {"id": 13, "rls": "admin", "perms": ["read"] * 100}
+        for payload in (small_payload, large_payload):
+            token = codec.encode(payload, "secret", algorithm)
+            assert token == plain_codec.encode(payload, "secret", algorithm)
+            assert codec.decode(token, "secret", [algorithm]) == payload
+            assert plain_codec.decode(token, "secret", [algorithm]) == payload
+
+    def test_encode_and_decode__falls_back_to_pyjwt(self):
+        """
+        This test verifies that other keys, algorithms and headers are
+        handled by pyjwt
+        """
+        codec = HMACJWTCodec("secret")
+        payload = {"id": 13}
+        token = codec.encode(payload, "other secret", "HS256")
+        assert jwt.decode(token, "other secret", algorithms=["HS256"]) == payload
+        assert codec.decode(token, "other secret", ["HS256"]) == payload
+
+        token = jwt.encode(payload, "secret", "HS256", headers={"kid": "praetorian"})
+        assert codec.decode(token, "secret", ["HS256"]) == payload
+
+    def test_decode__fails_on_bad_tokens(self):
+        """
+        This test verifies that tampered tokens, disallowed algorithms and
+        malformed segments are rejected
+        """
+        codec = HMACJWTCodec("secret")
+        token = codec.encode({"id": 13}, "secret", "HS256")
+        (header, payload, signature) = token.split(".")
+
+        with pytest.raises(jwt.InvalidAlgorithmError):
+            codec.decode(token, "secret", ["HS512"])
+
+        forged_payload = codec.encode({"id": 1}, "secret", "HS256").split(".")[1]
+        forged = ".".join([header, forged_payload, signature])
+        with pytest.raises(jwt.InvalidSignatureError):
+            codec.decode(forged, "secret", ["HS256"])
+
+        with pytest.raises(jwt.InvalidSignatureError):
+            codec.decode(".".join([header, payload]), "secret", ["HS256"])
+
+        with pytest.raises(jwt.DecodeError):
+            codec.decode(".".join([header, payload, "a"]), "secret", ["HS256"])
+
+        token = codec.encode([1, 2, 3], "secret", "HS256")
+        with pytest.raises(jwt.DecodeError):
+            codec.decode(token, "secret", ["HS256"])
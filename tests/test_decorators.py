@@ -1,8 +1,17 @@
+import os
+import sys
+
+import flask
 import pendulum
 import plummet
 import pytest
 
-from flask_praetorian.exceptions import MissingRoleError
+from flask import jsonify
+
+import flask_praetorian
+from flask_praetorian import Praetorian, auth_accepted, current_user
+from flask_praetorian.exceptions import MissingRoleError, MisusedGuardToken
+from flask_praetorian.utilities import current_guard
 
 
 class TestPraetorianDecorators:
@@ -70,6 +79,36 @@ class TestPraetorianDecorators:
             assert "success" in response.json["message"]
             assert response.json["user"] == self.the_dude.username
 
+    def test_auth_accepted__anonymous_raises_nothing(self, app, default_guard):
+        """
+        This test verifies that an anonymous request to an @auth_accepted
+        route raises and catches no exceptions within praetorian or flask's
+        app context globals
+        """
+        watched = (
+            os.path.dirname(flask_praetorian.__file__),
+            os.path.dirname(flask.__file__),
+        )
+        raised = []
+
+        def trace(frame, event, arg):
+            if event == "exception" and frame.f_code.co_filename.startswith(watched):
+                raised.append((frame.f_code.co_name, arg[0].__name__))
+            return trace
+
+        @auth_accepted
+        def kinda_protected():
+            return "success"
+
+        with app.test_request_context("/kinda_protected"):
+            sys.settrace(trace)
+            try:
+                assert kinda_protected() == "success"
+            finally:
+                sys.settrace(None)
+            assert flask_praetorian.utilities.app_context_has_jwt_data() is False
+        assert raised == []
+
     def test_auth_required(self, client, default_guard, use_cookie):
         """
         This test verifies that the @auth_required decorator can be used
@@ -233,3 +272,100 @@ class TestPraetorianDecorators:
             headers=default_guard.pack_header_for_user(self.jesus),
         )
         assert response.status_code == 200
+
+    def test_bound_decorators(self, app, client, user_class, mixin_user_class, db):
+        """
+        This test verifies that decorators bound to a specific guard may be
+        used to protect routes and that several guards with different user
+        classes may be mounted in one app. It also verifies that a token
+        issued by one guard may not be used with another
+        """
+        staff_guard = Praetorian(app, user_class, name="staff")
+        client_guard = Praetorian(app, mixin_user_class, name="client")
+        assert current_guard("staff") is staff_guard
+        assert current_guard("client") is client_guard
+
+        @app.route("/staff_only")
+        @staff_guard.auth_required
+        @staff_guard.roles_accepted("admin")
+        def staff_only():
+            return jsonify(user=current_user().username)
+
+        @app.route("/clients_welcome")
+        @client_guard.auth_accepted
+        def clients_welcome():
+            try:
+                authed_user = current_user().username
+            except Exception:
+                authed_user = None
+            return jsonify(user=authed_user)
+
+        bunny = mixin_user_class(username="Bunny", roles="client")
+        db.session.add(bunny)
+        db.session.commit()
+
+        response = client.get(
+            "/staff_only",
+            headers=staff_guard.pack_header_for_user(self.walter),
+        )
+        assert response.status_code == 200
+        assert response.json["user"] == self.walter.username
+
+        response = client.get(
+            "/staff_only",
+            headers=staff_guard.pack_header_for_user(self.donnie),
+        )
+        assert response.status_code == 403
+
+        response = client.get(
+            "/clients_welcome",
+            headers=client_guard.pack_header_for_user(bunny),
+        )
+        assert response.status_code == 200
+        assert response.json["user"] == bunny.username
+
+        response = client.get("/clients_welcome")
+        assert response.status_code == 200
+        assert response.json["user"] is None
+
+        response = client.get(
+            "/staff_only",
+            headers=client_guard.pack_header_for_user(bunny),
+        )
+        assert response.status_code == 401
+        assert MisusedGuardToken.__name__ in response.json["error"]
+
+    def test_bound_decorators__stacked_guards(
+        self, app, client, user_class, mixin_user_class, db
+    ):
+        """
+        This test verifies that when decorators bound to different guards are
+        stacked, each guard verifies the token itself, so a token issued by
+        one guard can not satisfy the decorators of another
+        """
+        staff_guard = Praetorian(app, user_class, name="staff")
+        client_guard = Praetorian(app, mixin_user_class, name="client")
+
+        @app.route("/staff_admins")
+        @client_guard.auth_required
+        @staff_guard.roles_required("admin")
+        def staff_admins():
+            return jsonify(user=current_user().username)
+
+        bunny = mixin_user_class(username="Bunny", roles="admin")
+        db.session.add(bunny)
+        db.session.commit()
+
+        response = client.get(
+            "/staff_admins",
+            headers=client_guard.pack_header_for_user(bunny),
+        )
+        assert response.status_code == 401
+        assert MisusedGuardToken.__name__ in response.json["error"]
+
+        response = client.get(
+            "/staff_admins",
+            headers=staff_guard.pack_header_for_user(self.walter),
+        )
+        assert response.status_code == 401
+        assert MisusedGuardToken.__name__ in response.json["error"]
@@ -0,0 +1,183 @@
+import threading
+
+import pytest
+
+from flask_praetorian.exceptions import HashMemoryExhausted
+from flask_praetorian.hashing import (
+    DIRECT_SCHEMES,
+    DirectHasher,
+    MemoryBudget,
+    ThreadedPasswordUpdater,
+    hash_memory_cost,
+)
+
+
+class ListPasswordUpdater(ThreadedPasswordUpdater):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.batches = []
+
+    def save_batch(self, updates):
+        self.batches.append(updates)
+
+
+class TestThreadedPasswordUpdater:
+    def test_update(self, app, user_class):
+        """
+        This test verifies that queued hashes are saved by the background
+        thread and that only the latest hash for a user is saved in a batch
+        """
+        updater = ListPasswordUpdater()
+        started = threading.Event()
+        release = threading.Event()
+        save_batch = updater._save_batch
+
+        def slow_save_batch(batch):
+            started.set()
+            release.wait()
+            save_batch(batch)
+
+        updater.worker.handle_batch = slow_save_batch
+        the_dude = user_class(id=13, username="TheDude")
+        walter = user_class(id=14, username="Walter")
+
+        with app.app_context():
+            updater.update(the_dude, "hash-1")
+            started.wait()
+            updater.update(the_dude, "hash-2")
+            updater.update(walter, "hash-3")
+            updater.update(the_dude, "hash-4")
+        release.set()
+        updater.join()
+        assert updater.batches == [
+            [(13, "hash-1")],
+            [(13, "hash-4"), (14, "hash-3")],
+        ]
+
+    def test_update__drops_hashes_when_queue_is_full(self, app, user_class, caplog):
+        """
+        This test verifies that an upgraded hash is dropped with a warning
+        when the queue is full
+        """
+        updater = ListPasswordUpdater(max_queue_size=1)
+        started = threading.Event()
+        release = threading.Event()
+        save_batch = updater._save_batch
+
+        def slow_save_batch(batch):
+            started.set()
+            release.wait()
+            save_batch(batch)
+
+        updater.worker.handle_batch = slow_save_batch
+        the_dude = user_class(id=13, username="TheDude")
+
+        with app.app_context():
+            updater.update(the_dude, "hash-1")
+            started.wait()
+            updater.update(the_dude, "hash-2")
+            updater.update(the_dude, "hash-3")
+        release.set()
+        updater.join()
+        assert updater.batches == [[(13, "hash-1")], [(13, "hash-2")]]
+        assert "queue is full" in caplog.text
+
+
+class TestHashMemoryCost:
+    def test_hash_memory_cost(self):
+        """
+        This test verifies that the memory cost of a hash is parsed from its
+        parameters for memory-hard schemes and is zero for other schemes
+        """
+        assert hash_memory_cost("$argon2id$v=19$m=65536,t=3,p=4$c2FsdA$aGFzaA") == (
+            64 * 1024 * 1024
+        )
+        assert hash_memory_cost(b"$argon2i$m=512,t=2,p=1$c2FsdA$aGFzaA") == 512 * 1024
+        assert hash_memory_cost("$scrypt$ln=16,r=8,p=1$c2FsdA$aGFzaA") == (
+            128 * 8 * 2**16
+        )
+        assert hash_memory_cost("$pbkdf2-sha512$25000$c2FsdA$aGFzaA") == 0
+        assert hash_memory_cost("") == 0
+        assert hash_memory_cost(None) == 0
+
+
+class TestMemoryBudget:
+    def test_reserve__waits_for_memory(self):
+        """
+        This test verifies that a reservation that would exceed the budget
+        waits until enough memory is released
+        """
+        budget = MemoryBudget(100)
+        reserved = threading.Event()
+
+        def reserve():
+            with budget.reserve(60):
+                reserved.set()
+
+        with budget.reserve(60):
+            thread = threading.Thread(target=reserve)
+            thread.start()
+            assert not reserved.wait(0.05)
+            assert budget.in_use == 60
+        thread.join()
+        assert reserved.is_set()
+        assert budget.in_use == 0
+
+    def test_reserve__rejects_after_timeout(self):
+        """
+        This test verifies that a reservation that cannot be made in time
+        raises a HashMemoryExhausted error, that costs above the limit are
+        clamped to it and that free hashes are never limited
+        """
+        budget = MemoryBudget(100, timeout=0)
+        with budget.reserve(500):
+            assert budget.in_use == 100
+            with pytest.raises(HashMemoryExhausted):
+                with budget.reserve(1):
+                    pass
+            with budget.reserve(0):
+                assert budget.in_use == 100
+        with budget.reserve(40):
+            with budget.reserve(60):
+                assert budget.in_use == 100
+        assert budget.in_use == 0
+
+
+class TestDirectHasher:
+    @pytest.mark.parametrize("name", ["pbkdf2_sha256", "pbkdf2_sha512", "scrypt"])
+    def test_hash_and_verify__match_passlib(self, name):
+        """
+        This test verifies that hashes made directly are verified by passlib
+        and that hashes made by passlib are verified directly
+        """
+        from passlib.context import CryptContext
+
+        pwd_ctx = CryptContext(schemes=[name])
+        scheme = DIRECT_SCHEMES[name]
+
+        hashed_password = scheme.hash("abides")
+        assert pwd_ctx.identify(hashed_password) == name
+        assert pwd_ctx.verify("abides", hashed_password)
+        assert not pwd_ctx.verify("nihilist", hashed_password)
+
+        hashed_password = pwd_ctx.hash("abides")
+        assert scheme.verify("abides", hashed_password)
+        assert not scheme.verify("nihilist", hashed_password)
+
+        with pytest.raises(ValueError):
+            scheme.verify("abides", scheme.ident + "not$a$hash")
+
+    def test_identify(self):
+        """
+        This test verifies that only hashes of allowed schemes that are
+        handled directly are identified
+        """
+        hasher = DirectHasher(["pbkdf2_sha512", "bcrypt"], "bcrypt")
+        assert hasher.default is None
+        sha512_hash = DIRECT_SCHEMES["pbkdf2_sha512"].hash("abides")
+        sha256_hash = DIRECT_SCHEMES["pbkdf2_sha256"].hash("abides")
+        assert hasher.identify(sha512_hash) is DIRECT_SCHEMES["pbkdf2_sha512"]
+        assert hasher.identify(sha256_hash) is None
+        assert hasher.identify("$2b$12$notabcrypthash") is None
+        assert hasher.identify("plaintext") is None
+        assert hasher.identify(None) is None
@@ -0,0 +1,281 @@
+import email
+import threading
+
+import flask
+import pytest
+
+from flask_praetorian import Praetorian
+from flask_praetorian.exceptions import ConfigurationError, EmailQueueFull
+from flask_praetorian.mail import (
+    EmailDispatcher,
+    MemoryMailBackend,
+    ThreadedEmailDispatcher,
+)
+
+
+class TestThreadedEmailDispatcher:
+    @pytest.fixture(autouse=True)
+    def setup(self, app, db, user_class, tmpdir):
+        """
+        This fixture prepares a reset email template and a user to send to
+        """
+        template_file = tmpdir.join("test_template.html")
+        template_file.write("<body>{{ token }}</body>")
+        app.config["PRAETORIAN_RESET_TEMPLATE"] = str(template_file)
+        app.config["PRAETORIAN_RESET_SENDER"] = "mailer.daemon@stranger.com"
+
+        self.the_dude = user_class(username="TheDude")
+        db.session.add(self.the_dude)
+        db.session.commit()
+
+        self.outbox = app.extensions["mailman"].outbox = []
+
+    def test_dispatch(self, app, user_class):
+        """
+        This test verifies that a guard with a threaded dispatcher returns
+        before the email is sent and that the email is sent in the background
+        """
+        dispatcher = ThreadedEmailDispatcher()
+        guard = Praetorian(app, user_class, email_dispatcher=dispatcher)
+
+        notification = guard.send_reset_email("the.dude@abides.com", self.the_dude)
+        dispatcher.join()
+        assert notification["result"] is True
+        assert [m.body for m in self.outbox] == [notification["message"]]
+
+    def test_dispatch__retries_failures(self, app, user_class, monkeypatch):
+        """
+        This test verifies that a message that fails to send is retried and
+        that it is given up on once the retries are used up
+        """
+        from flask_mailman.backends.locmem import EmailBackend
+
+        send_messages = EmailBackend.send_messages
+        failures = [RuntimeError("Nihilists!")]
+
+        def flaky_send_messages(backend, messages):
+            if failures:
+                raise failures.pop()
+            return send_messages(backend, messages)
+
+        monkeypatch.setattr(EmailBackend, "send_messages", flaky_send_messages)
+        dispatcher = ThreadedEmailDispatcher(retries=1, retry_delay=0)
+        guard = Praetorian(app, user_class, email_dispatcher=dispatcher)
+
+        notification = guard.send_reset_email("the.dude@abides.com", self.the_dude)
+        dispatcher.join()
+        assert notification["result"] is True
+        assert len(self.outbox) == 1
+
+        failures.extend([RuntimeError("Nihilists!"), RuntimeError("Nihilists!")])
+        notification = guard.send_reset_email("the.dude@abides.com", self.the_dude)
+        dispatcher.join()
+        assert notification["result"] is False
+        assert "Nihilists!" in notification["error"]
+        assert len(self.outbox) == 1
+
+    def test_dispatch__opens_connections(self, app, user_class, monkeypatch):
+        """
+        This test verifies that messages are only sent over open connections,
+        that a connection closed after a failure is reopened for the retry,
+        and that every connection opened is closed again
+        """
+        from flask_mailman.backends.locmem import EmailBackend
+
+        send_messages = EmailBackend.send_messages
+        failures = [RuntimeError("Nihilists!")]
+        counts = dict(opened=0, closed=0, sent_closed=0)
+
+        def counting_open(backend):
+            if not getattr(backend, "is_open", False):
+                backend.is_open = True
+                counts["opened"] += 1
+
+        def counting_close(backend):
+            if getattr(backend, "is_open", False):
+                backend.is_open = False
+                counts["closed"] += 1
+
+        def counting_send_messages(backend, messages):
+            if not getattr(backend, "is_open", False):
+                counts["sent_closed"] += 1
+            if failures:
+                raise failures.pop()
+            return send_messages(backend, messages)
+
+        monkeypatch.setattr(EmailBackend, "open", counting_open)
+        monkeypatch.setattr(EmailBackend, "close", counting_close)
+        monkeypatch.setattr(EmailBackend, "send_messages", counting_send_messages)
+        dispatcher = ThreadedEmailDispatcher(retries=1, retry_delay=0)
+        guard = Praetorian(app, user_class, email_dispatcher=dispatcher)
+
+        notification = guard.send_reset_email("the.dude@abides.com", self.the_dude)
+        dispatcher.join()
+        assert notification["result"] is True
+        assert counts == dict(opened=2, closed=2, sent_closed=0)
+
+    def test_dispatch__fails_when_queue_is_full(self, app, user_class, monkeypatch):
+        """
+        This test verifies that dispatching fails with an EmailQueueFull error
+        when the queue is full
+        """
+        started = threading.Event()
+        release = threading.Event()
+        dispatcher = ThreadedEmailDispatcher(max_queue_size=1)
+        send_batch = dispatcher._send_batch
+
+        def slow_send_batch(batch):
+            started.set()
+            release.wait()
+            send_batch(batch)
+
+        monkeypatch.setattr(dispatcher.worker, "handle_batch", slow_send_batch)
+        guard = Praetorian(app, user_class, email_dispatcher=dispatcher)
+
+        guard.send_reset_email("the.dude@abides.com", self.the_dude)
+        started.wait()
+        guard.send_reset_email("the.dude@abides.com", self.the_dude)
+        with pytest.raises(EmailQueueFull):
+            guard.send_reset_email("the.dude@abides.com", self.the_dude)
+        release.set()
+        dispatcher.join()
+        assert len(self.outbox) == 2
+
+    def test_custom_dispatcher(self, app, user_class):
+        """
+        This test verifies that a custom dispatcher receives the rendered
+        notification and message instead of the email being sent
+        """
+
+        class ListDispatcher(EmailDispatcher):
+            def __init__(self):
+                self.dispatched = []
+
+            def dispatch(self, notification, message):
+                self.dispatched.append((notification, message))
+
+        dispatcher = ListDispatcher()
+        guard = Praetorian(app, user_class, email_dispatcher=dispatcher)
+        notification = guard.send_reset_email("the.dude@abides.com", self.the_dude)
+        assert dispatcher.dispatched[0][0] is notification
+        assert dispatcher.dispatched[0][1].to == ["the.dude@abides.com"]
+        assert self.outbox == []
+
+
+class CapturedUser:
+    """
+    Provides a user that does not need a database so that the capture
+    backends can be tested on an app without any extensions
+    """
+
+    def __init__(self, id, username):
+        self.id = id
+        self.username = username
+        self.password = None
+        self.rolenames = []
+
+    @property
+    def identity(self):
+        return self.id
+
+    @classmethod
+    def lookup(cls, username):
+        return None
+
+    @classmethod
+    def identify(cls, id):
+        return None
+
+
+class TestCaptureMailBackends:
+    @pytest.fixture
+    def bare_app(self, tmpdir):
+        """
+        This fixture provides an app that has no mail extension
+        """
+        template_file = tmpdir.join("test_template.html")
+        template_file.write("<body>{{ token }}</body>")
+        app = flask.Flask(__name__)
+        app.config["SECRET_KEY"] = "secret"
+        app.config["PRAETORIAN_RESET_TEMPLATE"] = str(template_file)
+        app.config["PRAETORIAN_RESET_SENDER"] = "mailer.daemon@stranger.com"
+        return app
+
+    def test_memory_backend(self, bare_app):
+        """
+        This test verifies that the memory backend captures single and bulk
+        emails without a mail extension
+        """
+        bare_app.config["PRAETORIAN_MAIL_BACKEND"] = "memory"
+        guard = Praetorian(bare_app, CapturedUser)
+        assert isinstance(guard.mail_backend, MemoryMailBackend)
+
+        the_dude = CapturedUser(1, "TheDude")
+        walter = CapturedUser(2, "Walter")
+        with bare_app.app_context():
+            notification = guard.send_reset_email("the.dude@abides.com", the_dude)
+            notifications = guard.send_reset_emails(
+                [
+                    ("the.dude@abides.com", the_dude),
+                    ("walter@sobchak.com", walter),
+                ]
+            )
+        assert [n["result"] for n in notifications] == [True, True]
+
+        outbox = guard.mail_backend.outbox
+        assert [m.to for m in outbox] == [
+            ["the.dude@abides.com"],
+            ["the.dude@abides.com"],
+            ["walter@sobchak.com"],
+        ]
+        assert outbox[0].body == notification["message"]
+        assert notification["token"] in outbox[0].body
+
+    def test_memory_backend__with_dispatcher(self, bare_app):
+        """
+        This test verifies that emails sent in the background are captured
+        """
+        bare_app.config["PRAETORIAN_MAIL_BACKEND"] = "memory"
+        dispatcher = ThreadedEmailDispatcher()
+        guard = Praetorian(bare_app, CapturedUser, email_dispatcher=dispatcher)
+        with bare_app.app_context():
+            notification = guard.send_reset_email(
+                "the.dude@abides.com",
+                CapturedUser(1, "TheDude"),
+            )
+        dispatcher.join()
+        assert notification["result"] is True
+        assert len(guard.mail_backend.outbox) == 1
+
+    def test_spool_backend(self, bare_app, tmpdir):
+        """
+        This test verifies that the spool backend writes each email to a file
+        and that it must be given a directory
+        """
+        bare_app.config["PRAETORIAN_MAIL_BACKEND"] = "spool"
+        with pytest.raises(ConfigurationError):
+            Praetorian(bare_app, CapturedUser)
+
+        spool_dir = tmpdir.join("spool")
+        bare_app.config["PRAETORIAN_MAIL_SPOOL_DIR"] = str(spool_dir)
+        guard = Praetorian(bare_app, CapturedUser)
+        with bare_app.app_context():
+            notification = guard.send_reset_email(
+                "the.dude@abides.com",
+                CapturedUser(1, "TheDude"),
+            )
+
+        [spooled] = spool_dir.listdir()
+        assert spooled.ext == ".eml"
+        message = email.message_from_bytes(spooled.read_binary())
+        assert message["To"] == "the.dude@abides.com"
+        assert message["From"] == "mailer.daemon@stranger.com"
+        assert notification["token"] in message.get_payload(decode=True).decode()
+
+    def test_unknown_backend(self, bare_app):
+        """
+        This test verifies that an unknown backend is a configuration error
+        """
+        bare_app.config["PRAETORIAN_MAIL_BACKEND"] = "carrier-pigeon"
+        with pytest.raises(ConfigurationError):
+            Praetorian(bare_app, CapturedUser)
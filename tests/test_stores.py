@@ -0,0 +1,162 @@
+from flask_praetorian.exceptions import ExpiredAccessError, InvalidTokenHeader
+from flask_praetorian.stores import (
+    MemoryClaimStore,
+    MemoryRefreshFamilyStore,
+    RejectedTokenCache,
+)
+
+
+class TestMemoryClaimStore:
+    def test_put_get_and_delete(self):
+        """
+        This test verifies that claims can be stored, fetched and discarded
+        """
+        store = MemoryClaimStore(clock=lambda: 1495391995)
+        claims = {"id": 13}
+        store.put("abides", claims, 1495391995)
+        assert store.get("abides") is claims
+        assert store.get("nihilist") is None
+
+        store.delete("abides")
+        store.delete("nihilist")
+        assert store.get("abides") is None
+        assert len(store) == 0
+
+    def test_discards_least_recently_used(self):
+        """
+        This test verifies that the least recently used claims are discarded
+        once the store is full
+        """
+        store = MemoryClaimStore(max_size=2, clock=lambda: 1495391995)
+        store.put("the-dude", {"id": 1}, 1495391995)
+        store.put("walter", {"id": 2}, 1495391995)
+        assert store.get("the-dude") == {"id": 1}
+
+        store.put("donny", {"id": 3}, 1495391995)
+        assert len(store) == 2
+        assert store.get("walter") is None
+        assert store.get("the-dude") == {"id": 1}
+        assert store.get("donny") == {"id": 3}
+
+    def test_discards_expired_claims(self):
+        """
+        This test verifies that claims are discarded once their token expires
+        and that expired claims are discarded before any unexpired claims to
+        make room for new ones
+        """
+        now = [1000]
+        store = MemoryClaimStore(max_size=2, clock=lambda: now[0])
+        store.put("the-dude", {"id": 1}, 1000)
+        assert store.get("the-dude") == {"id": 1}
+        now[0] += 1
+        assert store.get("the-dude") is None
+        assert len(store) == 0
+
+        store.put("walter", {"id": 2}, 2000)
+        store.put("donny", {"id": 3}, 1005)
+        assert store.get("donny") == {"id": 3}
+        now[0] += 10
+        store.put("maude", {"id": 4}, 2000)
+        assert len(store) == 2
+        assert store.get("walter") == {"id": 2}
+        assert store.get("maude") == {"id": 4}
+        assert store.get("donny") is None
+
+class TestMemoryRefreshFamilyStore:
+    def test_rotate(self):
+        """
+        This test verifies that a family rotates when its current token is
+        refreshed, tolerates its previous token within the grace period and is
+        revoked when any other token is refreshed
+        """
+        store = MemoryRefreshFamilyStore()
+        store.start("fam", "jti-1", 90, 1000)
+        assert store.rotate("fam", "jti-1", "jti-2", 100, 5, 1000) == "jti-2"
+        assert store.rotate("fam", "jti-1", "jti-3", 105, 5, 1000) == "jti-2"
+        assert store.rotate("fam", "jti-2", "jti-4", 106, 5, 1000) == "jti-4"
+        assert not store.is_revoked("fam")
+
+        assert store.rotate("fam", "jti-2", "jti-5", 120, 5, 1000) is None
+        assert store.is_revoked("fam")
+        assert store.rotate("fam", "jti-4", "jti-6", 121, 5, 1000) is None
+
+    def test_rotate__unknown_family(self):
+        """
+        This test verifies that unknown families are rejected unless they are
+        adopted, and that adopted families start being tracked
+        """
+        store = MemoryRefreshFamilyStore()
+        assert store.rotate("fam", "jti-1", "jti-2", 100, 0, 1000) is None
+        assert len(store) == 0
+        assert store.rotate("fam", "jti-1", "jti-2", 100, 0, 1000, adopt=True) == (
+            "jti-2"
+        )
+        assert store.rotate("fam", "jti-1", "jti-3", 101, 0, 1000, adopt=True) is None
+        assert store.is_revoked("fam")
+
+    def test_revoked_and_rotated_families_outlive_eviction(self):
+        """
+        This test verifies that once the store is full only families that
+        were never rotated are discarded, so that a revoked token is not
+        accepted again, and that families are discarded once they expire
+        """
+        store = MemoryRefreshFamilyStore(max_size=3)
+        store.start("the-dude", "j1", 100, 1000)
+        assert store.rotate("the-dude", "j1", "j2", 101, 0, 1000) == "j2"
+        assert store.rotate("the-dude", "j1", "j3", 102, 0, 1000) is None
+        store.start("walter", "w1", 103, 1000)
+        assert store.rotate("walter", "w1", "w2", 104, 0, 1000) == "w2"
+
+        for i in range(3):
+            store.start("donny-{}".format(i), "d{}".format(i), 105 + i, 1000)
+        assert len(store) == 3
+        assert store.is_revoked("the-dude")
+        assert store.rotate("the-dude", "j1", "j4", 110, 0, 1000) is None
+        assert store.rotate("the-dude", "j2", "j4", 110, 0, 1000) is None
+        assert store.rotate("walter", "w2", "w3", 111, 0, 1000) == "w3"
+        assert store.rotate("donny-0", "d0", "d9", 112, 0, 1000) is None
+
+        store.start("maude", "m1", 1001, 2000)
+        assert len(store) == 1
+        assert not store.is_revoked("the-dude")
+
+    def test_revoke(self):
+        """
+        This test verifies that families can be revoked
+        """
+        store = MemoryRefreshFamilyStore()
+        store.start("the-dude", "jti-1", 100, 1000)
+        store.revoke("the-dude")
+        store.revoke("walter")
+        assert store.is_revoked("the-dude")
+        assert store.is_revoked("walter")
+        assert store.rotate("the-dude", "jti-1", "jti-2", 101, 0, 1000) is None
+
+
+class TestRejectedTokenCache:
+    def test_get_and_put(self):
+        """
+        This test verifies that rejections are cached until they expire and
+        that hits and misses are counted
+        """
+        cache = RejectedTokenCache()
+        assert cache.get("abides", 100) is None
+        cache.put("abides", ExpiredAccessError, "expired", 160)
+        assert cache.get("abides", 160) == (ExpiredAccessError, "expired")
+        assert cache.get("abides", 161) is None
+        assert len(cache) == 0
+        assert cache.stats() == dict(hits=1, misses=2, size=0)
+
+    def test_discards_least_recently_used(self):
+        """
+        This test verifies that the least recently used rejections are
+        discarded once the cache is full
+        """
+        cache = RejectedTokenCache(max_size=2)
+        cache.put("abides", InvalidTokenHeader, "forged", 160)
+        cache.put("nihilist", InvalidTokenHeader, "forged", 160)
+        assert cache.get("abides", 100) is not None
+        cache.put("bowling", InvalidTokenHeader, "forged", 160)
+        assert cache.get("nihilist", 100) is None
+        assert cache.get("abides", 100) is not None
+        assert cache.get("bowling", 100) is not None
@@ -20,3 +20,48 @@ class TestSQLAlchemyUserMixin:
         db.session.delete(the_dude)
         db.session.commit()
         default_guard.init_app(app, user_class)
+
+
+class TestSQLAlchemyPasswordUpdater:
+    def test_authenticate__saves_upgraded_hash(
+        self, app, db, mixin_user_class, user_class, default_guard
+    ):
+        """
+        This test verifies that a hash upgraded during authentication is saved
+        by the updater instead of being assigned to the user
+        """
+        app.config["PRAETORIAN_HASH_SCHEME"] = "bcrypt"
+        legacy_guard = flask_praetorian.Praetorian(app, mixin_user_class)
+        the_dude = mixin_user_class(
+            username="TheDude",
+            password=legacy_guard.hash_password("abides"),
+        )
+        db.session.add(the_dude)
+        db.session.commit()
+        legacy_hash = the_dude.password
+
+        del app.config["PRAETORIAN_HASH_SCHEME"]
+        app.config["PRAETORIAN_HASH_DEPRECATED_SCHEMES"] = ["bcrypt"]
+        app.config["PRAETORIAN_HASH_AUTOUPDATE"] = True
+        updater = flask_praetorian.SQLAlchemyPasswordUpdater(
+            db,
+            mixin_user_class,
+            column="password",
+        )
+        mixin_guard = flask_praetorian.Praetorian(
+            app,
+            mixin_user_class,
+            password_updater=updater,
+        )
+        assert mixin_guard.authenticate("TheDude", "abides") == the_dude
+        assert the_dude.password == legacy_hash
+        db.session.commit()
+
+        updater.join()
+        db.session.expire_all()
+        assert the_dude.password.startswith("$pbkdf2-sha512$")
+        assert mixin_guard.authenticate("TheDude", "abides") == the_dude
+
+        db.session.delete(the_dude)
+        db.session.commit()
+        default_guard.init_app(app, user_class)
@@ -7,6 +7,7 @@ from uuid import uuid4
 from flask_praetorian.utilities import (
     add_jwt_data_to_app_context,
     app_context_has_jwt_data,
+    identity_claim,
     is_jsonable,
     remove_jwt_data_from_app_context,
     current_user,
@@ -170,3 +171,18 @@ class TestPraetorianUtilities:
         assert not is_jsonable(set({}))
         assert not is_jsonable(datetime.now())
         assert not is_jsonable(uuid4())
+
+    def test_identity_claim(self):
+        """
+        This test verifies that identity_claim returns json-serializable
+        identities as they are and converts other identities to strings
+        """
+        assert identity_claim(13) == 13
+        assert identity_claim("TheDude") == "TheDude"
+        assert identity_claim(2.0) == 2.0
+        assert identity_claim(None) is None
+        assert identity_claim([1, "a"]) == [1, "a"]
+        assert identity_claim({"a": 1}) == {"a": 1}
+        assert identity_claim({"a": uuid4()}).startswith("{'a': UUID(")
+        the_id = uuid4()
+        assert identity_claim(the_id) == str(the_id)